@@ -1,43 +1,340 @@
+import asyncio
 import json
+import os
+import threading
 import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from budget import TRUNCATION_REASONS
+from metrics import get_metrics, record_parse, record_parse_failure
+from provider_registry import available_providers, is_builtin, load_provider, provider_for_class
+from response_cache import cache_key, get_response_cache
+from retry_policy import CircuitOpenError, RetryPolicy, TruncatedResponseError, classify_error, get_circuit_breaker
+from step_parser import parse_step_with_method
+
+# Upper bound for max_tokens when a step cut off by the limit is retried with more room
+MAX_RETRY_TOKENS = 2048
 
 # Abstract base class for API handlers
 class BaseHandler(ABC):
+    # Config keys a provider outside the built-in ones is built from; a memoized
+    # handler is rebuilt when one of them changes
+    config_keys = ()
+
     def __init__(self):
-        self.max_attempts = 3  # Maximum number of retry attempts
-        self.retry_delay = 1   # Delay between retry attempts in seconds
+        self.retry_policy = RetryPolicy()  # Attempts, backoff and Retry-After handling
+        self.temperature = None
+        self.cache = None      # Optional ResponseCache shared between handlers
+
+    @classmethod
+    def from_config(cls, config):
+        # Build the handler from the config dict, used for providers registered by naming
+        # convention or entry point: the values of config_keys are passed to the constructor
+        # in order. Providers whose constructor differs override this.
+        return cls(*(config.get(key) for key in cls.config_keys))
 
     @abstractmethod
     def _make_request(self, messages, max_tokens):
         # Abstract method to be implemented by subclasses
         pass
 
+    @property
+    def requires_stable_prefix(self):
+        # True when earlier messages must be resent byte-identical (e.g. for server-side prefix caching)
+        return False
+
+    def cache_params(self):
+        # Everything besides the messages that determines the response
+        return {
+            "handler": type(self).__name__,
+            "model": getattr(self, "model", None),
+            "endpoint": getattr(self, "url", None) or getattr(self, "api_base", None),
+            "temperature": self.temperature,
+        }
+
+    def _cache_key(self, messages, max_tokens, is_final_answer):
+        if self.cache is None:
+            return None
+        return cache_key(self.cache_params(), messages, max_tokens, is_final_answer)
+
+    def _cache_lookup(self, key, call):
+        entry = self.cache.get(key) if key is not None else None
+        if entry is None:
+            return None
+        # The original response's length, so the step budget sizes the next call as it did
+        # then and that call's cache key (which includes max_tokens) matches too
+        call.extra["cached_completion_tokens"] = entry.get("completion_tokens")
+        return entry["step"]
+
+    def _cache_store(self, key, step, call):
+        # Only clean responses are stored: error steps never reach this point, and output
+        # that did not parse ("raw") or was cut off at max_tokens would otherwise be
+        # replayed to every identical query until it expires
+        cacheable = call.parse_method != "raw" and call.extra.get("finish_reason") not in TRUNCATION_REASONS
+        if key is not None and cacheable:
+            self.cache.set(key, {"step": step, "completion_tokens": call.completion_tokens})
+        return step
+
+    @property
+    def circuit_breaker(self):
+        # Shared by every handler talking to the same backend endpoint
+        endpoint = getattr(self, "url", None) or getattr(self, "api_base", None)
+        return get_circuit_breaker(f"{type(self).__name__}:{endpoint}" if endpoint else type(self).__name__)
+
+    def _retry_delay(self, error, attempt, breaker):
+        # Seconds to wait before retrying after `error`, or None to give up
+        classification = classify_error(error)
+        if isinstance(error, json.JSONDecodeError):
+            record_parse_failure()
+        if classification.provider_failure:
+            breaker.record_failure()
+        elif not isinstance(error, CircuitOpenError):
+            breaker.release_trial()
+        delay = self.retry_policy.next_delay(classification, attempt)
+        if delay is not None and isinstance(error, TruncatedResponseError):
+            # Nothing to wait for: the same provider is asked again with more room
+            return 0.0
+        return delay
+
+    def _check_truncation(self, call, step, max_tokens):
+        # The step parsed (possibly repaired), but the provider says it stopped at max_tokens:
+        # ask again with more room while there is room to give
+        if call.extra.get("finish_reason") in TRUNCATION_REASONS and max_tokens < MAX_RETRY_TOKENS:
+            raise TruncatedResponseError(step, max_tokens)
+        return step
+
+    def _retry_max_tokens(self, error, max_tokens):
+        if isinstance(error, TruncatedResponseError):
+            return min(max_tokens * 2, MAX_RETRY_TOKENS)
+        return max_tokens
+
+    def _give_up(self, call, error, is_final_answer, attempts):
+        # Out of retries: a truncated step is still better than an error step (it is not cached)
+        if isinstance(error, TruncatedResponseError):
+            return self._finish_call(call, error.step)
+        return self._finish_call(call, self._error_response(str(error), is_final_answer, attempts))
+
+    def _track_call(self, is_final_answer):
+        # Instrument one call; the record is emitted to the metrics sinks when it ends
+        return get_metrics().track_call(type(self).__name__, getattr(self, "model", None), is_final_answer)
+
+    def _mark_response(self, call):
+        # Handlers record TTFB when the response headers arrive; clients that only hand
+        # back the complete response (e.g. LiteLLM) get the full response time instead
+        if call.ttfb is None:
+            call.mark_first_byte()
+
+    def _finish_call(self, call, step, cache_hit=False):
+        call.cache_hit = cache_hit
+        call.finish(step)
+        return step
+
     def make_api_call(self, messages, max_tokens, is_final_answer=False):
-        # Attempt to make an API call with retry logic
-        for attempt in range(self.max_attempts):
-            try:
-                response = self._make_request(messages, max_tokens)
-                return self._process_response(response, is_final_answer)
-            except Exception as e:
-                if attempt == self.max_attempts - 1:
-                    return self._error_response(str(e), is_final_answer)
-                time.sleep(self.retry_delay)
+        # Attempt to make an API call with retry logic, answering from the cache when possible
+        with self._track_call(is_final_answer) as call:
+            key = self._cache_key(messages, max_tokens, is_final_answer)
+            cached = self._cache_lookup(key, call)
+            if cached is not None:
+                return self._finish_call(call, cached, cache_hit=True)
+            breaker = self.circuit_breaker
+            attempt = 0
+            while True:
+                call.start_attempt()
+                try:
+                    breaker.before_call()
+                    response = self._make_request(messages, max_tokens)
+                    self._mark_response(call)
+                    breaker.record_success()
+                    step = self._check_truncation(call, self._process_response(response, is_final_answer), max_tokens)
+                    return self._finish_call(call, self._cache_store(key, step, call))
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, breaker)
+                    if delay is None:
+                        return self._give_up(call, e, is_final_answer, attempt + 1)
+                    max_tokens = self._retry_max_tokens(e, max_tokens)
+                    time.sleep(delay)
+                    attempt += 1
+
+    async def _amake_request(self, messages, max_tokens):
+        # Async counterpart of _make_request. Handlers without a native async client
+        # run the blocking request in a worker thread so the event loop stays free.
+        return await asyncio.to_thread(self._make_request, messages, max_tokens)
+
+    async def amake_api_call(self, messages, max_tokens, is_final_answer=False):
+        # Async version of make_api_call; waiting between retries does not block the event loop
+        with self._track_call(is_final_answer) as call:
+            key = self._cache_key(messages, max_tokens, is_final_answer)
+            cached = self._cache_lookup(key, call)
+            if cached is not None:
+                return self._finish_call(call, cached, cache_hit=True)
+            breaker = self.circuit_breaker
+            attempt = 0
+            while True:
+                call.start_attempt()
+                try:
+                    breaker.before_call()
+                    response = await self._amake_request(messages, max_tokens)
+                    self._mark_response(call)
+                    breaker.record_success()
+                    step = self._check_truncation(call, self._process_response(response, is_final_answer), max_tokens)
+                    return self._finish_call(call, self._cache_store(key, step, call))
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, breaker)
+                    if delay is None:
+                        return self._give_up(call, e, is_final_answer, attempt + 1)
+                    max_tokens = self._retry_max_tokens(e, max_tokens)
+                    await asyncio.sleep(delay)
+                    attempt += 1
+
+    def _make_stream_request(self, messages, max_tokens):
+        # Yield the response text chunk by chunk. Handlers without native streaming
+        # support fall back to a single chunk holding the whole response.
+        yield self._make_request(messages, max_tokens)
+
+    def stream_api_call(self, messages, max_tokens, is_final_answer=False):
+        # Generator yielding raw text chunks as they arrive; the processed step is its return value.
+        # Retries only happen before the first chunk, since partial output has already been shown.
+        with self._track_call(is_final_answer) as call:
+            key = self._cache_key(messages, max_tokens, is_final_answer)
+            cached = self._cache_lookup(key, call)
+            if cached is not None:
+                yield json.dumps(cached)
+                return self._finish_call(call, cached, cache_hit=True)
+            breaker = self.circuit_breaker
+            attempt = 0
+            while True:
+                call.start_attempt()
+                chunks = []
+                try:
+                    breaker.before_call()
+                    for chunk in self._make_stream_request(messages, max_tokens):
+                        if chunk:
+                            if not chunks:
+                                call.mark_first_byte()
+                            chunks.append(chunk)
+                            yield chunk
+                    breaker.record_success()
+                    step = self._process_stream_response("".join(chunks), is_final_answer)
+                    return self._finish_call(call, self._cache_store(key, step, call))
+                except Exception as e:
+                    delay = self._retry_delay(e, attempt, breaker)
+                    if chunks or delay is None:
+                        return self._finish_call(call, self._error_response(str(e), is_final_answer, attempt + 1))
+                    time.sleep(delay)
+                    attempt += 1
+
+    def _process_stream_response(self, response, is_final_answer):
+        # Process the concatenated text of a streamed response
+        return self._process_response(response, is_final_answer)
 
     def _process_response(self, response, is_final_answer):
-        # Default response processing (can be overridden by subclasses)
-        return json.loads(response)
+        # Turn the model output into a validated step with the shared parsing pipeline.
+        # Handlers whose raw response is not the model's text override this to extract it first.
+        step, method = parse_step_with_method(response, is_final_answer)
+        record_parse(method)
+        return step
 
-    def _error_response(self, error_msg, is_final_answer):
-        # Generate an error response
+    def _error_response(self, error_msg, is_final_answer, attempts):
+        # Generate an error response. It ends the chain, so no further calls are spent on it.
         return {
             "title": "Error",
-            "content": f"Failed to generate {'final answer' if is_final_answer else 'step'} after {self.max_attempts} attempts. Error: {error_msg}",
-            "next_action": "final_answer" if is_final_answer else "continue"
+            "content": f"Failed to generate {'final answer' if is_final_answer else 'step'} after {attempts} attempt{'s' if attempts != 1 else ''}. Error: {error_msg}",
+            "next_action": "final_answer",
+            "error": True
         }
 
-# Import derived handlers
-from handlers.ollama_handler import OllamaHandler
-from handlers.perplexity_handler import PerplexityHandler
-from handlers.groq_handler import GroqHandler
-from handlers.litellm_handler import LiteLLMHandler
+def __getattr__(name):
+    # BACKENDS and the handler classes (e.g. api_handlers.GroqHandler) are resolved
+    # on first access through the provider registry, so importing this module
+    # does not import any provider SDK
+    if name == "BACKENDS":
+        return available_providers()
+    backend = provider_for_class(name)
+    if backend is not None:
+        return load_provider(backend)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def _build_handler(backend, config):
+    handler_class = load_provider(backend)
+    if not is_builtin(backend):
+        return handler_class.from_config(config)
+    if backend == "Ollama":
+        return handler_class(
+            config['OLLAMA_URL'],
+            config['OLLAMA_MODEL'],
+            prefix_cache=str(config.get('OLLAMA_PREFIX_CACHE', '')).lower() in ('1', 'true', 'yes', 'on'),
+            keep_alive=config.get('OLLAMA_KEEP_ALIVE') or None,
+            num_ctx=int(config['OLLAMA_NUM_CTX']) if config.get('OLLAMA_NUM_CTX') else None
+        )
+    elif backend == "Perplexity AI":
+        return handler_class(config['PERPLEXITY_API_KEY'], config['PERPLEXITY_MODEL'], config.get('PERPLEXITY_BASE_URL') or None)
+    elif backend == "Groq":
+        return handler_class(config['GROQ_API_KEY'], config['GROQ_MODEL'], config.get('GROQ_BASE_URL') or None)
+    elif backend == "LiteLLM":
+        return handler_class(
+            config.get('LITELLM_MODEL', ''),
+            config.get('LITELLM_API_BASE', ''),
+            config.get('LITELLM_API_KEY', '')
+        )
+    elif backend == "Composite":
+        # Races or hedges the listed backends, e.g. COMPOSITE_BACKENDS=Groq,Ollama
+        members = [name.strip() for name in config.get('COMPOSITE_BACKENDS', '').split(',') if name.strip()]
+        if not members or "Composite" in members:
+            raise ValueError("COMPOSITE_BACKENDS must list the backends to combine, e.g. Groq,Ollama")
+        return handler_class(
+            [get_handler(member, config) for member in members],
+            mode=config.get('COMPOSITE_MODE') or 'hedge',
+            hedge_percentile=float(config.get('COMPOSITE_HEDGE_PERCENTILE') or 0.95)
+        )
+    raise ValueError(f"Unknown backend: {backend}")
+
+# Config keys each backend depends on; only these invalidate a memoized handler
+HANDLER_CONFIG_KEYS = {
+    "Ollama": ('OLLAMA_URL', 'OLLAMA_MODEL', 'OLLAMA_PREFIX_CACHE', 'OLLAMA_KEEP_ALIVE', 'OLLAMA_NUM_CTX'),
+    "Perplexity AI": ('PERPLEXITY_API_KEY', 'PERPLEXITY_MODEL', 'PERPLEXITY_BASE_URL'),
+    "Groq": ('GROQ_API_KEY', 'GROQ_MODEL', 'GROQ_BASE_URL'),
+    "LiteLLM": ('LITELLM_MODEL', 'LITELLM_API_BASE', 'LITELLM_API_KEY'),
+}
+# The composite handler depends on the settings of every backend it wraps
+HANDLER_CONFIG_KEYS["Composite"] = ('COMPOSITE_BACKENDS', 'COMPOSITE_MODE', 'COMPOSITE_HEDGE_PERCENTILE') + tuple(
+    key for backend_keys in HANDLER_CONFIG_KEYS.values() for key in backend_keys)
+
+MAX_CACHED_HANDLERS = 32
+_handlers = OrderedDict()
+_handlers_lock = threading.Lock()
+
+def _provider_config(backend, config):
+    # load_env_vars only knows the built-in keys; the config_keys of other providers
+    # fall back to the environment, which load_env_vars keeps in sync with .env
+    if is_builtin(backend):
+        return config
+    found = {key: os.environ[key] for key in load_provider(backend).config_keys
+             if config.get(key) is None and key in os.environ}
+    return dict(config, **found) if found else config
+
+def get_handler(backend, config):
+    # Return the handler for a backend from a config dict using the .env keys.
+    # Handlers (and their SDK clients) are memoized process-wide per backend and
+    # relevant config values, so Streamlit reruns and sessions share them.
+    config = _provider_config(backend, config)
+    config_keys = HANDLER_CONFIG_KEYS.get(backend) or load_provider(backend).config_keys
+    key = (backend,) + tuple(config.get(name) for name in config_keys)
+    with _handlers_lock:
+        handler = _handlers.get(key)
+        if handler is not None:
+            _handlers.move_to_end(key)
+            return handler
+    handler = _build_handler(backend, config)
+    handler.cache = get_response_cache()
+    with _handlers_lock:
+        # Another session may have built the same handler meanwhile; keep the first one
+        handler = _handlers.setdefault(key, handler)
+        # Bounded, since half-typed settings (e.g. a LiteLLM model name) each produce a key
+        while len(_handlers) > MAX_CACHED_HANDLERS:
+            _handlers.popitem(last=False)
+    return handler
+
+def clear_handlers():
+    # Drop every memoized handler, e.g. after changing settings that are not part of the key
+    with _handlers_lock:
+        _handlers.clear()
@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from api_handlers import BACKENDS, get_handler
+from config import load_env_vars
+from context import ContextCompactor
+from http_session import aclose_async_client
+from reasoning import ReasoningChain, agenerate_response
+from response_cache import get_response_cache
+from self_consistency import VOTING_METHODS, arun_self_consistency
+
+# Headless batch runner: reads queries from JSONL, runs the reasoning chains
+# concurrently on one event loop and streams every step to a JSONL output file.
+#
+# Input lines are either a JSON string or an object with a "query" key and
+# optional "id", "backend", "prompt_name" and "prompt_version" keys. Example:
+#   python app/batch.py queries.jsonl -o results.jsonl --backend Ollama --concurrency 8
+#
+# With --self-consistency K every query runs K chains and writes one "vote"
+# record with the aggregated answer instead of the individual steps.
+#
+# Every backend has its own queue and as many workers as its concurrency
+# limit, so a backlog on one backend never holds up queries for another. The
+# K chains of a self-consistency query count against that limit as well.
+
+# Queries read ahead per worker; bounds memory for any input size
+QUEUED_PER_WORKER = 8
+
+
+def resolve_backend(name):
+    # Case-insensitive backend lookup that also accepts the first word ("perplexity")
+    for backend in BACKENDS:
+        if name.lower() in (backend.lower(), backend.split()[0].lower()):
+            return backend
+    raise ValueError(f"Unknown backend: {name} (expected one of {', '.join(BACKENDS)})")
+
+
+def parse_limits(values):
+    # Parse repeated BACKEND=N options into a dict
+    limits = {}
+    for value in values or []:
+        name, _, limit = value.partition("=")
+        limits[resolve_backend(name)] = int(limit)
+    return limits
+
+
+def read_queries(path):
+    # Yield (id, query, backend, chain options, error) lazily so the input file is never fully loaded.
+    # A line that is not a valid query is yielded with only its id and the error, so one bad
+    # line is reported in the output instead of stopping the whole run.
+    with (sys.stdin if path == "-" else open(path, "r")) as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, None, None, f"Line {line_number} is not valid JSON: {e}"
+                continue
+            if isinstance(record, str):
+                record = {"query": record}
+            if not isinstance(record, dict):
+                yield line_number, None, None, None, f"Line {line_number} is not a query string or object"
+                continue
+            query_id = record.get("id", line_number)
+            if not isinstance(record.get("query"), str) or not record["query"].strip():
+                yield query_id, None, None, None, f'Line {line_number} has no "query"'
+                continue
+            options = {key: record[key] for key in ("prompt_name", "prompt_version") if key in record}
+            yield query_id, record["query"], record.get("backend"), options, None
+
+
+class JsonlWriter:
+    # Appends one record per line and flushes immediately so results are never buffered in memory
+    def __init__(self, path):
+        self.file = sys.stdout if path == "-" else open(path, "a")
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class BatchRunner:
+    def __init__(self, config, default_backend, writer, concurrency=4, backend_limits=None, chain_options=None,
+                 samples=1, vote_method="majority", resume=True):
+        self.config = config
+        self.samples = samples
+        self.vote_method = vote_method
+        self.chain_options = chain_options or {}
+        self.resume = resume
+        self.default_backend = default_backend
+        self.writer = writer
+        self.concurrency = concurrency
+        self.backend_limits = backend_limits or {}
+        self._handlers = {}
+        self.completed = 0
+        self.failed = 0
+
+    def _handler(self, backend):
+        if backend not in self._handlers:
+            self._handlers[backend] = get_handler(backend, self.config)
+        return self._handlers[backend]
+
+    def _limit(self, backend):
+        return max(1, self.backend_limits.get(backend, self.concurrency))
+
+    def _workers(self, backend):
+        # Queries run at once on a backend; a self-consistency query runs up to K chains itself
+        return max(1, self._limit(backend) // self.samples)
+
+    def _call_summary(self, call):
+        # Per-step provider figures worth keeping next to the step itself
+        if call is None:
+            return None
+        keys = ("attempts", "ttfb", "prompt_tokens", "completion_tokens", "prompt_eval_time", "outcome")
+        return {key: call[key] for key in keys if call.get(key) is not None}
+
+    async def run_vote(self, query_id, query, backend, chain_options):
+        result = await arun_self_consistency(query, self._handler(backend), self.samples, self.vote_method,
+                                             max_concurrent=min(self.samples, self._limit(backend)),
+                                             resume=self.resume, **chain_options)
+        self.writer.write({
+            "id": query_id,
+            "backend": backend,
+            "type": "vote",
+            "answer": result["answer"],
+            "votes": result["votes"],
+            "method": result["method"],
+            "agreement": result["agreement"],
+            "completed_chains": result["completed_chains"],
+            "stopped_early": result["stopped_early"],
+            "total_time": result["total_time"],
+        })
+
+    async def run_query(self, query_id, query, backend, options=None):
+        chain_options = dict(self.chain_options, **(options or {}))
+        if self.samples > 1:
+            try:
+                await self.run_vote(query_id, query, backend, chain_options)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                self.writer.write({"id": query_id, "backend": backend, "type": "error", "error": str(e)})
+            return
+        written = 0
+        try:
+            chain = ReasoningChain(query, **chain_options)
+            async for steps, total_thinking_time in agenerate_response(query, self._handler(backend), chain=chain, resume=self.resume):
+                # Only write the steps that are new since the last yield
+                for title, content, thinking_time in steps[written:]:
+                    record_type = "final" if title == "Final Answer" else "step"
+                    self.writer.write({
+                        "id": query_id,
+                        "backend": backend,
+                        "type": record_type,
+                        "index": written,
+                        "title": title,
+                        "content": content,
+                        "thinking_time": thinking_time,
+                        "call": self._call_summary(chain.call_stats[written]),
+                    })
+                    written += 1
+                if total_thinking_time is not None:
+                    self.writer.write({
+                        "id": query_id,
+                        "backend": backend,
+                        "type": "summary",
+                        "steps": written,
+                        "total_thinking_time": total_thinking_time,
+                        "context": chain.context_savings(),
+                        "stop_reason": chain.stop_reason,
+                        "budget": chain.budget.stats(),
+                    })
+            self.completed += 1
+        except Exception as e:
+            self.failed += 1
+            self.writer.write({"id": query_id, "backend": backend, "type": "error", "error": str(e)})
+
+    async def run(self, queries):
+        queues = {}
+        workers = {}
+
+        async def work(queue):
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                await self.run_query(*item)
+
+        for query_id, query, backend, options, error in queries:
+            if error is None:
+                try:
+                    backend = resolve_backend(str(backend)) if backend else self.default_backend
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                self.failed += 1
+                self.writer.write({"id": query_id, "type": "error", "error": error})
+                continue
+            if backend not in queues:
+                count = self._workers(backend)
+                queues[backend] = asyncio.Queue(count * QUEUED_PER_WORKER)
+                workers[backend] = [asyncio.create_task(work(queues[backend])) for _ in range(count)]
+            # Only waits while this backend's own queue is full
+            await queues[backend].put((query_id, query, backend, options))
+
+        for backend, queue in queues.items():
+            for _ in workers[backend]:
+                await queue.put(None)
+        await asyncio.gather(*(task for tasks in workers.values() for task in tasks))
+        await aclose_async_client()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run multi1 reasoning chains over a JSONL file of queries")
+    parser.add_argument("input", help="JSONL file with one query per line, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL file to append results to (default: stdout)")
+    parser.add_argument("--backend", default="Ollama", help=f"Default backend: {', '.join(BACKENDS)}")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent chains per backend")
+    parser.add_argument("--backend-concurrency", action="append", metavar="BACKEND=N",
+                        help="Override the concurrency limit for one backend (repeatable)")
+    parser.add_argument("--prompt", dest="prompt_name", help="System prompt variant (default: app/system_prompt.txt)")
+    parser.add_argument("--prompt-version", type=int, help="Version of the prompt variant (default: latest)")
+    parser.add_argument("--compaction", help="Context compaction strategies, e.g. strip,summarize (default: MULTI1_CONTEXT_STRATEGY)")
+    parser.add_argument("--keep-last", type=int, default=3, help="Steps kept verbatim by last_n/summarize compaction")
+    parser.add_argument("--confidence-threshold", type=float,
+                        help="Ask for the final answer once a step is at least this confident (0-100)")
+    parser.add_argument("--token-budget", type=int, help="Prompt + completion tokens allowed per chain")
+    parser.add_argument("--time-budget", type=float, help="Seconds allowed per chain")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Rerun every chain instead of replaying or resuming it from MULTI1_TRACE_DB")
+    parser.add_argument("--self-consistency", type=int, default=1, metavar="K",
+                        help="Run K chains per query and vote on the final answer")
+    parser.add_argument("--vote", choices=VOTING_METHODS, default="majority",
+                        help="How self-consistency votes are counted (default: majority)")
+    args = parser.parse_args(argv)
+
+    writer = JsonlWriter(args.output)
+    runner = BatchRunner(
+        load_env_vars(),
+        resolve_backend(args.backend),
+        writer,
+        concurrency=args.concurrency,
+        backend_limits=parse_limits(args.backend_concurrency),
+        chain_options={
+            "prompt_name": args.prompt_name,
+            "prompt_version": args.prompt_version,
+            "compaction": ContextCompactor(args.compaction, args.keep_last) if args.compaction else None,
+            "budget": {
+                "confidence_threshold": args.confidence_threshold,
+                "token_budget": args.token_budget,
+                "time_budget": args.time_budget,
+            },
+        },
+        resume=not args.no_resume,
+        samples=args.self_consistency,
+        vote_method=args.vote,
+    )
+    start_time = time.time()
+    try:
+        asyncio.run(runner.run(read_queries(args.input)))
+    finally:
+        writer.close()
+    print(f"Completed {runner.completed} queries ({runner.failed} failed) in {time.time() - start_time:.2f} seconds",
+          file=sys.stderr)
+    cache = get_response_cache()
+    if cache is not None:
+        print(f"Response cache: {cache.stats()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import os
+import re
+import time
+
+# Step budget for reasoning chains: decides how many tokens each call may
+# generate and when the chain should stop stepping and ask for the final answer.
+#
+#   max_tokens     with adaptive_tokens, sized from the lengths of the earlier
+#                  steps (times `headroom`) and doubled after a truncated step,
+#                  within [min_step_tokens, max_step_tokens]. min_step_tokens
+#                  defaults to step_max_tokens: a smaller limit never makes a
+#                  step that ends on its own faster, it only cuts longer ones
+#                  short and costs a truncation retry, so by default the size
+#                  only grows
+#   early stop     a step whose confidence reaches confidence_threshold, or two
+#                  consecutive steps whose contents overlap by at least
+#                  convergence_threshold (word-set similarity)
+#   hard budget    token_budget (prompt + completion tokens over the whole chain)
+#                  and time_budget (seconds); the chain stops stepping when one
+#                  more step plus the final answer would not fit
+#
+# A budget holds the state of one chain; ReasoningChain builds one per chain
+# from the environment (see budget_from_env) and any options it is given.
+
+STOP_REASONS = ("final_answer", "max_steps", "confidence", "converged", "token_budget", "time_budget", "error")
+TRUNCATION_REASONS = ("length", "max_tokens")
+
+_WORD = re.compile(r"\w+")
+
+
+def similarity(a, b):
+    # Jaccard similarity of the word sets of two texts, 0.0 to 1.0
+    words_a = set(_WORD.findall(a.lower()))
+    words_b = set(_WORD.findall(b.lower()))
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+def _estimate_text_tokens(text):
+    # Same ~4 characters per token estimate as context.estimate_tokens
+    return max(1, len(text) // 4)
+
+
+class StepBudget:
+    def __init__(self, max_steps=10, step_max_tokens=300, final_max_tokens=200, adaptive_tokens=True,
+                 min_step_tokens=None, max_step_tokens=1024, headroom=1.5, confidence_threshold=None,
+                 min_steps=1, convergence_threshold=0.9, token_budget=None, time_budget=None):
+        self.max_steps = max_steps
+        self.step_max_tokens = step_max_tokens
+        self.final_max_tokens = final_max_tokens
+        self.adaptive_tokens = adaptive_tokens
+        self.min_step_tokens = step_max_tokens if min_step_tokens is None else min(min_step_tokens, step_max_tokens)
+        self.max_step_tokens = max(max_step_tokens, step_max_tokens)
+        self.headroom = headroom
+        self.confidence_threshold = confidence_threshold
+        self.min_steps = min_steps
+        self.convergence_threshold = convergence_threshold
+        self.token_budget = token_budget
+        self.time_budget = time_budget
+
+        self.started = time.time()
+        self.lengths = []           # completion tokens of each step, reported or estimated
+        self.truncated_steps = 0
+        self.last_truncated = False
+        self.last_max_tokens = step_max_tokens
+        self.used_tokens = 0
+        self.last_call_tokens = 0
+        self.last_call_time = 0.0
+        self.previous_content = None
+
+    def settings(self):
+        # Configuration without the per-chain state, e.g. to tell chains run under other limits apart
+        return {
+            "max_steps": self.max_steps,
+            "step_max_tokens": self.step_max_tokens,
+            "final_max_tokens": self.final_max_tokens,
+            "adaptive_tokens": self.adaptive_tokens,
+            "min_step_tokens": self.min_step_tokens,
+            "max_step_tokens": self.max_step_tokens,
+            "headroom": self.headroom,
+            "confidence_threshold": self.confidence_threshold,
+            "min_steps": self.min_steps,
+            "convergence_threshold": self.convergence_threshold,
+            "token_budget": self.token_budget,
+            "time_budget": self.time_budget,
+        }
+
+    def step_tokens(self):
+        # max_tokens for the next reasoning step
+        if not self.adaptive_tokens or not self.lengths:
+            tokens = self.step_max_tokens
+        else:
+            tokens = int(max(self.lengths[-3:]) * self.headroom)
+            if self.last_truncated:
+                tokens = max(tokens, self.last_max_tokens * 2)
+        tokens = min(self.max_step_tokens, max(self.min_step_tokens, tokens))
+        self.last_max_tokens = tokens
+        return tokens
+
+    def final_tokens(self):
+        # max_tokens for the final answer, which is at least final_max_tokens
+        if not self.adaptive_tokens or not self.lengths:
+            return self.final_max_tokens
+        typical = int(max(self.lengths[-3:]) * self.headroom)
+        return min(self.max_step_tokens, max(self.final_max_tokens, typical))
+
+    def _truncated(self, completion_tokens, call):
+        finish_reason = str((call or {}).get("finish_reason") or "").lower()
+        if finish_reason:
+            return finish_reason in TRUNCATION_REASONS
+        return completion_tokens >= self.last_max_tokens
+
+    def observe(self, step_data, thinking_time, call=None):
+        # Account for a finished call; `call` is its metrics record as a dict, if any
+        call = call or {}
+        content = step_data.get("content", "")
+        cache_hit = call.get("outcome") == "cache_hit"
+        completion_tokens = call.get("cached_completion_tokens" if cache_hit else "completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = _estimate_text_tokens(str(content)) + 10
+        if cache_hit:
+            # Served from the response cache: no tokens spent, but the step's length is recorded as
+            # in the run that cached it, so the max_tokens sequence (and with it the cache keys of
+            # the following steps) is the same on every run. Truncated steps are never cached.
+            self.lengths.append(completion_tokens)
+            self.last_truncated = False
+            return
+        prompt_tokens = call.get("prompt_tokens") or 0
+        self.last_call_tokens = prompt_tokens + completion_tokens
+        self.used_tokens += self.last_call_tokens
+        self.last_call_time = thinking_time
+        self.lengths.append(completion_tokens)
+        self.last_truncated = self._truncated(completion_tokens, call)
+        self.truncated_steps += self.last_truncated
+
+    def stop_reason(self, step_data, step_count):
+        # Why the chain should ask for the final answer after this step, or None to keep going
+        content = str(step_data.get("content", ""))
+        previous, self.previous_content = self.previous_content, content
+        if step_count >= self.min_steps:
+            confidence = step_data.get("confidence")
+            if self.confidence_threshold is not None and isinstance(confidence, (int, float)) \
+                    and confidence >= self.confidence_threshold:
+                return "confidence"
+            if self.convergence_threshold and previous is not None \
+                    and similarity(previous, content) >= self.convergence_threshold:
+                return "converged"
+        # One more step and the final answer each cost at least about as much as the last call
+        if self.token_budget is not None and self.used_tokens + 2 * self.last_call_tokens > self.token_budget:
+            return "token_budget"
+        if self.time_budget is not None and time.time() - self.started + 2 * self.last_call_time > self.time_budget:
+            return "time_budget"
+        if step_count > self.max_steps:
+            return "max_steps"
+        return None
+
+    def stats(self):
+        return {
+            "used_tokens": self.used_tokens,
+            "elapsed": time.time() - self.started,
+            "truncated_steps": self.truncated_steps,
+            "step_tokens": self.lengths,
+        }
+
+
+def _env_number(name, cast):
+    value = os.getenv(name, "").strip()
+    return cast(value) if value else None
+
+
+def budget_from_env(**options):
+    # StepBudget configured from the environment; options given here take precedence
+    settings = {
+        "adaptive_tokens": os.getenv("MULTI1_ADAPTIVE_TOKENS", "true").lower() in ("1", "true", "yes", "on"),
+        "min_step_tokens": _env_number("MULTI1_MIN_STEP_TOKENS", int),
+        "max_step_tokens": _env_number("MULTI1_MAX_STEP_TOKENS", int),
+        "confidence_threshold": _env_number("MULTI1_CONFIDENCE_THRESHOLD", float),
+        "convergence_threshold": _env_number("MULTI1_CONVERGENCE_THRESHOLD", float),
+        "token_budget": _env_number("MULTI1_TOKEN_BUDGET", int),
+        "time_budget": _env_number("MULTI1_TIME_BUDGET", float),
+    }
+    settings.update(options)
+    return StepBudget(**{key: value for key, value in settings.items() if value is not None})
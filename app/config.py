@@ -0,0 +1,48 @@
+import os
+from dotenv import dotenv_values
+
+ENV_PATH = os.path.join(os.path.dirname(__file__), "..", ".env")
+
+# Variables set in the real environment take precedence over .env, as with load_dotenv
+_process_env = set(os.environ)
+
+_cached_mtime = None
+_cached_config = None
+
+def _env_mtime():
+    try:
+        return os.path.getmtime(ENV_PATH)
+    except OSError:
+        return None
+
+def load_env_vars():
+    # The .env file is only parsed again when it changes on disk
+    global _cached_mtime, _cached_config
+    mtime = _env_mtime()
+    if _cached_config is not None and mtime == _cached_mtime:
+        return dict(_cached_config)
+    # Unlike load_dotenv, values that came from an older .env are replaced on change
+    for key, value in dotenv_values(ENV_PATH).items():
+        if key not in _process_env and value is not None:
+            os.environ[key] = value
+    _cached_mtime = mtime
+    _cached_config = {
+        'OLLAMA_URL': os.getenv('OLLAMA_URL', 'http://localhost:11434'),
+        'OLLAMA_MODEL': os.getenv('OLLAMA_MODEL', 'mistral'),
+        'OLLAMA_PREFIX_CACHE': os.getenv('OLLAMA_PREFIX_CACHE', ''),
+        'OLLAMA_KEEP_ALIVE': os.getenv('OLLAMA_KEEP_ALIVE', ''),
+        'OLLAMA_NUM_CTX': os.getenv('OLLAMA_NUM_CTX', ''),
+        'PERPLEXITY_API_KEY': os.getenv('PERPLEXITY_API_KEY', ''),
+        'PERPLEXITY_MODEL': os.getenv('PERPLEXITY_MODEL', 'mistral-7b-instruct'),
+        'PERPLEXITY_BASE_URL': os.getenv('PERPLEXITY_BASE_URL', ''),
+        'GROQ_API_KEY': os.getenv('GROQ_API_KEY', ''),
+        'GROQ_MODEL': os.getenv('GROQ_MODEL', 'mixtral-8x7b-32768'),
+        'GROQ_BASE_URL': os.getenv('GROQ_BASE_URL', ''),
+        'LITELLM_MODEL': os.getenv('LITELLM_MODEL', 'ollama/qwen2:1.5b'),
+        'LITELLM_API_BASE': os.getenv('LITELLM_API_BASE', ''),
+        'LITELLM_API_KEY': os.getenv('LITELLM_API_KEY', ''),
+        'COMPOSITE_BACKENDS': os.getenv('COMPOSITE_BACKENDS', 'Groq,Ollama'),
+        'COMPOSITE_MODE': os.getenv('COMPOSITE_MODE', 'hedge'),
+        'COMPOSITE_HEDGE_PERCENTILE': os.getenv('COMPOSITE_HEDGE_PERCENTILE', '0.95')
+    }
+    return dict(_cached_config)
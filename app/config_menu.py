@@ -1,22 +1,10 @@
 import streamlit as st
-import os
-from dotenv import load_dotenv, set_key
-
-def load_env_vars():
-    load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
-    return {
-        'OLLAMA_URL': os.getenv('OLLAMA_URL', 'http://localhost:11434'),
-        'OLLAMA_MODEL': os.getenv('OLLAMA_MODEL', 'mistral'),
-        'PERPLEXITY_API_KEY': os.getenv('PERPLEXITY_API_KEY', ''),
-        'PERPLEXITY_MODEL': os.getenv('PERPLEXITY_MODEL', 'mistral-7b-instruct'),
-        'GROQ_API_KEY': os.getenv('GROQ_API_KEY', ''),
-        'GROQ_MODEL': os.getenv('GROQ_MODEL', 'mixtral-8x7b-32768')
-    }
+from dotenv import set_key
+from config import ENV_PATH, load_env_vars
 
 def save_env_vars(config):
-    env_path = os.path.join(os.path.dirname(__file__), "..", ".env")
     for key, value in config.items():
-        set_key(env_path, key, value)
+        set_key(ENV_PATH, key, value)
 
 def config_menu():
     st.sidebar.markdown("## 🛠️ Configuration")
@@ -47,3 +35,6 @@ def display_config(backend, config):
         st.sidebar.markdown(f"- 🧠 Perplexity AI Model: `{config['PERPLEXITY_MODEL']}`")
     elif backend == "Groq":
         st.sidebar.markdown(f"- ⚡ Groq Model: `{config['GROQ_MODEL']}`")
+    elif backend == "Composite":
+        st.sidebar.markdown(f"- 🔀 Backends: `{config['COMPOSITE_BACKENDS']}`")
+        st.sidebar.markdown(f"- 🏁 Mode: `{config['COMPOSITE_MODE']}`")
@@ -0,0 +1,114 @@
+import json
+import os
+import re
+
+# Context compaction for reasoning chains.
+#
+# Every step is appended to the conversation and the whole history is sent
+# again on the next call, so prompt size grows with each step. A compactor
+# rewrites the step messages before each call; the chain keeps the full
+# history. Strategies can be combined with commas, e.g. "strip,last_n":
+#   none       send the history unchanged
+#   strip      drop confidence and any other metadata, keeping title/content/next_action
+#   last_n     keep only the last `keep_last` steps verbatim and drop older ones
+#   summarize  keep the last `keep_last` steps and replace older ones with a one-line-per-step summary
+
+STRATEGIES = ("none", "strip", "last_n", "summarize")
+KEPT_FIELDS = ("title", "content", "next_action")
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(messages):
+    # Rough token count (~4 characters per token plus per-message overhead), good enough for comparisons
+    return sum(len(message["content"]) // 4 + 4 for message in messages)
+
+
+def _parse_step(content):
+    try:
+        step = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    return step if isinstance(step, dict) else None
+
+
+def _first_sentence(text, limit=160):
+    sentence = _SENTENCE_END.split(text.strip(), 1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit].rstrip() + "…"
+
+
+class ContextCompactor:
+    def __init__(self, strategy="none", keep_last=3):
+        strategies = {name.strip() for name in strategy.split(",") if name.strip()} if strategy else set()
+        unknown = strategies - set(STRATEGIES)
+        if unknown:
+            raise ValueError(f"Unknown context strategy: {', '.join(sorted(unknown))}")
+        self.strategies = strategies - {"none"}
+        self.keep_last = max(0, keep_last)
+
+    @property
+    def enabled(self):
+        return bool(self.strategies)
+
+    @property
+    def prefix_stable(self):
+        # strip rewrites every step the same way on every call; last_n and summarize
+        # change earlier messages as the chain grows, which defeats server-side prefix caching
+        return not self.strategies & {"last_n", "summarize"}
+
+    def stable_variant(self):
+        # The closest compactor that keeps earlier messages byte-identical between calls
+        return ContextCompactor(",".join(sorted(self.strategies & {"strip"})) or "none", self.keep_last)
+
+    def _strip(self, message):
+        step = _parse_step(message["content"])
+        if step is None:
+            return message
+        stripped = {key: step[key] for key in KEPT_FIELDS if key in step}
+        return dict(message, content=json.dumps(stripped))
+
+    def _summary(self, older):
+        lines = []
+        for index, message in older:
+            step = _parse_step(message["content"]) or {}
+            title = step.get("title", "Step")
+            content = step.get("content", message["content"])
+            lines.append(f"{index}. {title}: {_first_sentence(str(content))}")
+        return {"role": "assistant", "content": "Summary of my earlier reasoning steps:\n" + "\n".join(lines)}
+
+    def compact(self, messages, prefix_length):
+        # Return the messages to send. The first `prefix_length` messages (system
+        # prompt, query, initial assistant turn) are never touched; every other
+        # assistant message is a reasoning step.
+        if not self.enabled:
+            return messages
+        prefix = messages[:prefix_length]
+        step_positions = [i for i in range(prefix_length, len(messages)) if messages[i]["role"] == "assistant"]
+
+        if "last_n" in self.strategies or "summarize" in self.strategies:
+            cutoff = len(step_positions) - self.keep_last
+            older = set(step_positions[:cutoff]) if cutoff > 0 else set()
+        else:
+            older = set()
+
+        compacted = list(prefix)
+        summarized = False
+        for position in range(prefix_length, len(messages)):
+            message = messages[position]
+            if position in older:
+                if "summarize" in self.strategies and not summarized:
+                    numbered = [(n, messages[p]) for n, p in enumerate(step_positions, 1) if p in older]
+                    compacted.append(self._summary(numbered))
+                    summarized = True
+                continue
+            if "strip" in self.strategies and message["role"] == "assistant":
+                message = self._strip(message)
+            compacted.append(message)
+        return compacted
+
+
+def compactor_from_env():
+    return ContextCompactor(
+        os.getenv("MULTI1_CONTEXT_STRATEGY", "none"),
+        int(os.getenv("MULTI1_CONTEXT_KEEP_LAST", 3)),
+    )
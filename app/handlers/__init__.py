@@ -1,6 +1,10 @@
-from .ollama_handler import OllamaHandler
-from .perplexity_handler import PerplexityHandler
-from .groq_handler import GroqHandler
-from .litellm_handler import LiteLLMHandler
+# Handler classes are imported on first access (e.g. `from handlers import GroqHandler`),
+# so importing the package does not import every provider SDK
 
-__all__ = ['OllamaHandler', 'PerplexityHandler', 'GroqHandler', 'LiteLLMHandler']
\ No newline at end of file
+__all__ = ['OllamaHandler', 'PerplexityHandler', 'GroqHandler', 'LiteLLMHandler', 'CompositeHandler']
+
+def __getattr__(name):
+    if name in __all__:
+        from provider_registry import load_provider, provider_for_class
+        return load_provider(provider_for_class(name))
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
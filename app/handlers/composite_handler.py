@@ -0,0 +1,150 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from api_handlers import BaseHandler
+from metrics import last_call, set_last_call
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    # Event loop on a background thread shared by every composite handler, where the
+    # member requests of the sync call path run as tasks that can be cancelled
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="multi1-composite", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def _is_valid(step):
+    return isinstance(step, dict) and not step.get("error")
+
+
+class CompositeHandler(BaseHandler):
+    # Wraps several handlers to cut tail latency.
+    #   race:  send every step to all handlers and keep the first valid answer
+    #   hedge: send to the first handler; if it is slower than its recent
+    #          `hedge_percentile` latency, also send to the next one and keep
+    #          whichever valid answer arrives first
+    # Losing requests are cancelled; the sync path runs the async one on a
+    # private event loop. Members without a native async client still run
+    # their blocking request in a thread, which cannot be interrupted.
+
+    def __init__(self, handlers, mode="hedge", hedge_percentile=0.95, min_hedge_delay=0.5,
+                 default_hedge_delay=5.0, window=200, min_samples=20):
+        super().__init__()
+        if not handlers:
+            raise ValueError("CompositeHandler needs at least one handler")
+        if mode not in ("race", "hedge"):
+            raise ValueError(f"Unknown composite mode: {mode}")
+        self.handlers = list(handlers)
+        self.mode = mode
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self._latencies = [deque(maxlen=window) for _ in self.handlers]
+        self._lock = threading.Lock()
+        self.model = "+".join(str(getattr(handler, "model", type(handler).__name__)) for handler in self.handlers)
+
+    @property
+    def requires_stable_prefix(self):
+        return any(getattr(handler, "requires_stable_prefix", False) for handler in self.handlers)
+
+    def _make_request(self, messages, max_tokens):
+        # Only reached through the BaseHandler call paths, which this class overrides;
+        # a plain request goes to the primary handler
+        return self.handlers[0]._make_request(messages, max_tokens)
+
+    def _process_response(self, response, is_final_answer):
+        return self.handlers[0]._process_response(response, is_final_answer)
+
+    def _observe(self, index, latency):
+        with self._lock:
+            self._latencies[index].append(latency)
+
+    def hedge_delay(self, index=0):
+        # Seconds to wait for handler `index` before hedging, from its recent latencies
+        with self._lock:
+            samples = sorted(self._latencies[index])
+        if len(samples) < self.min_samples:
+            return self.default_hedge_delay
+        position = min(len(samples) - 1, int(self.hedge_percentile * len(samples)))
+        return max(self.min_hedge_delay, samples[position])
+
+    # Member calls run as tasks in a copy of the caller's context (cache sample, step label),
+    # and return their metrics record so the winner's becomes the caller's last_call()
+
+    async def _atimed_call(self, index, messages, max_tokens, is_final_answer):
+        start = time.perf_counter()
+        step = await self.handlers[index].amake_api_call(messages, max_tokens, is_final_answer)
+        if _is_valid(step):
+            self._observe(index, time.perf_counter() - start)
+        return step, last_call()
+
+    def make_api_call(self, messages, max_tokens, is_final_answer=False):
+        # Runs the async path on the private loop, so losing requests are cancelled rather than
+        # left running in a thread; the coroutine is scheduled in a copy of the caller's context
+        async def call():
+            step = await self.amake_api_call(messages, max_tokens, is_final_answer)
+            return step, last_call()
+
+        future = asyncio.run_coroutine_threadsafe(call(), _get_loop())
+        try:
+            step, record = future.result()
+        except BaseException:
+            future.cancel()
+            raise
+        set_last_call(record)
+        return step
+
+    async def amake_api_call(self, messages, max_tokens, is_final_answer=False):
+        pending = {}
+        next_index = 0
+        last_step = None
+
+        def launch():
+            nonlocal next_index
+            task = asyncio.ensure_future(self._atimed_call(next_index, messages, max_tokens, is_final_answer))
+            pending[task] = next_index
+            next_index += 1
+
+        launch()
+        if self.mode == "race":
+            while next_index < len(self.handlers):
+                launch()
+
+        try:
+            while pending:
+                hedging = self.mode == "hedge" and next_index < len(self.handlers)
+                timeout = self.hedge_delay(next_index - 1) if hedging else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    pending.pop(task)
+                    last_step, record = task.result()
+                    set_last_call(record)
+                    if _is_valid(last_step):
+                        return last_step
+                if hedging and not pending:
+                    launch()
+            return last_step
+        finally:
+            # Cancel the losing requests (or all of them if the caller was cancelled)
+            for task in pending:
+                task.cancel()
+
+    def stream_api_call(self, messages, max_tokens, is_final_answer=False):
+        # Racing token streams is not supported; the winning step is emitted as one chunk
+        step = self.make_api_call(messages, max_tokens, is_final_answer)
+        yield json.dumps(step)
+        return step
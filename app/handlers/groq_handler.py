@@ -1,11 +1,34 @@
 import groq
 from api_handlers import BaseHandler
+from http_session import ASYNC_FIRST_BYTE_HOOKS, FIRST_BYTE_HOOKS
+from metrics import record_finish_reason, record_usage
 
 class GroqHandler(BaseHandler):
-    def __init__(self, api_key, model):
+    def __init__(self, api_key, model, base_url=None):
         super().__init__()
-        self.client = groq.Groq(api_key=api_key)
+        self.api_key = api_key
+        # None uses the SDK default (https://api.groq.com)
+        self.api_base = base_url or None
+        # max_retries=0: RetryPolicy and the circuit breaker are the only retry layer,
+        # otherwise every attempt could turn into three requests under rate limits
+        self.client = groq.Groq(api_key=api_key, base_url=self.api_base, max_retries=0,
+                                http_client=groq.DefaultHttpxClient(event_hooks=FIRST_BYTE_HOOKS))
+        self._async_client = None
         self.model = model
+        self.temperature = 0.2
+
+    @property
+    def async_client(self):
+        # Created on first async use so sync-only sessions don't pay for it
+        if self._async_client is None:
+            self._async_client = groq.AsyncGroq(
+                api_key=self.api_key, base_url=self.api_base, max_retries=0,
+                http_client=groq.DefaultAsyncHttpxClient(event_hooks=ASYNC_FIRST_BYTE_HOOKS))
+        return self._async_client
+
+    def _record_usage(self, usage):
+        if usage is not None:
+            record_usage(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
 
     def _make_request(self, messages, max_tokens):
         # Make a request to the Groq API
@@ -13,7 +36,40 @@ class GroqHandler(BaseHandler):
             model=self.model,
             messages=messages,
             max_tokens=max_tokens,
-            temperature=0.2,
+            temperature=self.temperature,
             response_format={"type": "json_object"}
         )
-        return response.choices[0].message.content
\ No newline at end of file
+        self._record_usage(response.usage)
+        record_finish_reason(response.choices[0].finish_reason)
+        return response.choices[0].message.content
+
+    async def _amake_request(self, messages, max_tokens):
+        # Async request to the Groq API
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            response_format={"type": "json_object"}
+        )
+        self._record_usage(response.usage)
+        record_finish_reason(response.choices[0].finish_reason)
+        return response.choices[0].message.content
+
+    def _make_stream_request(self, messages, max_tokens):
+        # Stream from the Groq API
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=self.temperature,
+            response_format={"type": "json_object"},
+            stream=True
+        )
+        for chunk in stream:
+            # Groq reports usage on the last chunk
+            x_groq = getattr(chunk, "x_groq", None)
+            self._record_usage(getattr(x_groq, "usage", None))
+            if chunk.choices:
+                record_finish_reason(chunk.choices[0].finish_reason)
+                yield chunk.choices[0].delta.content or ""
@@ -1,7 +1,10 @@
 from api_handlers import BaseHandler
-from litellm import completion, set_verbose
+from litellm import acompletion, completion, set_verbose
 from pydantic import BaseModel, Field
-import json
+import logging
+from metrics import record_finish_reason, record_usage
+
+logger = logging.getLogger('multi1')
 
 class ResponseSchema(BaseModel):
     title: str = Field(..., description="Title of the reasoning step")
@@ -13,39 +16,51 @@ class LiteLLMHandler(BaseHandler):
     def __init__(self, model, api_base=None, api_key=None):
         super().__init__()
         self.model = model
+        self.temperature = 0.5
         self.api_base = api_base
         self.api_key = api_key
 
-    def _make_request(self, messages, max_tokens):
-        set_verbose=True
-        response = completion(
+    def _completion_kwargs(self, messages, max_tokens, stream):
+        return dict(
             model=self.model,
             messages=messages,
             response_format= { "type": "json_schema", "json_schema": ResponseSchema.model_json_schema()  , "strict": True },
             max_tokens=max_tokens,
-            temperature=0.5,
+            temperature=self.temperature,
             api_base=self.api_base,
             api_key=self.api_key,
-            stream=False,
+            stream=stream,
         )
+
+    def _completion(self, messages, max_tokens, stream):
+        return completion(**self._completion_kwargs(messages, max_tokens, stream))
+
+    def _record_usage(self, response):
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record_usage(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+    def _make_request(self, messages, max_tokens):
+        set_verbose=True
+        response = self._completion(messages, max_tokens, stream=False)
+        self._record_usage(response)
+        record_finish_reason(response.choices[0].finish_reason)
     
-        # Parse the JSON content from the response
+        # The JSON content is parsed by the shared step parser
         content = response.choices[0].message.content
-        print("\nResponse from LiteLLM:")
-        print(content)
-        print("===\n")
-        
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            print("Warning: Response is not valid JSON. Formatting raw content.")
-            return {
-                "title": "Raw Response",
-                "content": "Warning: Response is not valid JSON. Formatting raw content.\n\n" + content,
-                "confidence": 50,
-                "next_action": "continue"
-            }
-
-    def _process_response(self, response, is_final_answer):
-        # The response is already validated against the schema
-        return response
\ No newline at end of file
+        logger.debug("Response from LiteLLM: %s", content)
+        return content
+
+    async def _amake_request(self, messages, max_tokens):
+        response = await acompletion(**self._completion_kwargs(messages, max_tokens, stream=False))
+        self._record_usage(response)
+        record_finish_reason(response.choices[0].finish_reason)
+        return response.choices[0].message.content
+
+    def _make_stream_request(self, messages, max_tokens):
+        # Stream the completion chunk by chunk
+        for chunk in self._completion(messages, max_tokens, stream=True):
+            self._record_usage(chunk)
+            if chunk.choices:
+                record_finish_reason(chunk.choices[0].finish_reason)
+                yield chunk.choices[0].delta.content or ""
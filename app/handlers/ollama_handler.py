@@ -1,51 +1,114 @@
 import json
-import requests
+import logging
 from api_handlers import BaseHandler
+from http_session import get_async_client, get_session, get_timeout
+from metrics import record_finish_reason, record_first_byte, record_usage
+
+logger = logging.getLogger('multi1')
 
 class OllamaHandler(BaseHandler):
-    def __init__(self, url, model):
+    # With prefix_cache enabled the model is kept loaded between calls (keep_alive)
+    # and the context size is pinned (num_ctx), so the server can reuse the KV cache
+    # of the unchanged conversation prefix instead of re-evaluating it every step.
+    # ReasoningChain keeps that prefix byte-identical while this mode is on.
+
+    def __init__(self, url, model, prefix_cache=False, keep_alive=None, num_ctx=None):
         super().__init__()
         self.url = url
         self.model = model
+        self.temperature = 0.2
+        self.prefix_cache = prefix_cache
+        self.keep_alive = keep_alive or ("30m" if prefix_cache else None)
+        self.num_ctx = num_ctx
+
+    @property
+    def requires_stable_prefix(self):
+        return self.prefix_cache
+
+    def _payload(self, messages, max_tokens, stream):
+        options = {
+            "num_predict": max_tokens,
+            "temperature": self.temperature
+        }
+        if self.num_ctx:
+            # A different num_ctx between calls makes Ollama reload the model and drop its cache
+            options["num_ctx"] = self.num_ctx
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "stream": stream,
+            "format": "json",
+            "options": options
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def _record_usage(self, data):
+        # Ollama reports token counts and durations (in nanoseconds) with the final message
+        def seconds(key):
+            return data[key] / 1e9 if key in data else None
+        record_usage(
+            prompt_tokens=data.get("prompt_eval_count"),
+            completion_tokens=data.get("eval_count"),
+            prompt_eval_time=seconds("prompt_eval_duration"),
+            eval_time=seconds("eval_duration"),
+            load_time=seconds("load_duration"),
+        )
+        # "length" when num_predict cut the answer short
+        record_finish_reason(data.get("done_reason"))
+        if self.prefix_cache and "prompt_eval_count" in data:
+            # prompt_eval_count only counts tokens that were not served from the cache
+            logger.debug("Ollama prompt eval: %s tokens in %.3fs, load %.3fs", data.get('prompt_eval_count'),
+                         seconds('prompt_eval_duration') or 0, seconds('load_duration') or 0)
 
     def _make_request(self, messages, max_tokens):
         # Make a request to the Ollama API
-        response = requests.post(
+        response = get_session().post(
             f"{self.url}/api/chat",
-            json={
-                "model": self.model,
-                "messages": messages,
-                "stream": False,
-                "format": "json",
-                "options": {
-                    "num_predict": max_tokens,
-                    "temperature": 0.2
-                }
-            }
+            json=self._payload(messages, max_tokens, stream=False),
+            timeout=get_timeout()
         )
+        record_first_byte(response.elapsed.total_seconds())
         response.raise_for_status()
-        print(response.json())
-        return response.json()["message"]["content"]
+        data = response.json()
+        logger.debug("Ollama response: %s", data)
+        self._record_usage(data)
+        return data["message"]["content"]
+
+    async def _amake_request(self, messages, max_tokens):
+        # Async request to the Ollama API through the pooled httpx client
+        response = await get_async_client().post(
+            f"{self.url}/api/chat",
+            json=self._payload(messages, max_tokens, stream=False)
+        )
+        response.raise_for_status()
+        data = response.json()
+        self._record_usage(data)
+        return data["message"]["content"]
+
+    def _make_stream_request(self, messages, max_tokens):
+        # Stream from the Ollama API, which sends one JSON object per line
+        with get_session().post(
+            f"{self.url}/api/chat",
+            json=self._payload(messages, max_tokens, stream=True),
+            stream=True,
+            timeout=get_timeout()
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise RuntimeError(data["error"])
+                yield data.get("message", {}).get("content", "")
+                if data.get("done"):
+                    # Keep reading to the end of the body so the connection goes back to the pool
+                    self._record_usage(data)
 
     def _process_response(self, response, is_final_answer):
-        # Process the Ollama API response
+        # Pull the model's text out of the Ollama API response and parse it
         if isinstance(response, dict) and 'message' in response:
-            content = response['message']['content']
-        else:
-            content = response
-
-        try:
-            parsed_content = json.loads(content)
-            if 'final_answer' in parsed_content:
-                return {
-                    "title": "Final Answer",
-                    "content": parsed_content['final_answer'],
-                    "next_action": "final_answer"
-                }
-            return parsed_content
-        except json.JSONDecodeError:
-            return {
-                "title": "Raw Response",
-                "content": content,
-                "next_action": "final_answer" if is_final_answer else "continue"
-            }
\ No newline at end of file
+            response = response['message']['content']
+        return super()._process_response(response, is_final_answer)
@@ -1,22 +1,32 @@
 import json
-import requests
+import logging
 from api_handlers import BaseHandler
+from http_session import get_async_client, get_session, get_timeout
+from metrics import record_finish_reason, record_first_byte, record_usage
+from retry_policy import BadRequestError
+
+logger = logging.getLogger('multi1')
+
+DEFAULT_BASE_URL = "https://api.perplexity.ai"
 
 class PerplexityHandler(BaseHandler):
-    def __init__(self, api_key, model):
+    def __init__(self, api_key, model, base_url=None):
         super().__init__()
         self.api_key = api_key
         self.model = model
+        # Any OpenAI-compatible endpoint works, e.g. a proxy or the benchmark's mock server
+        self.url = (base_url or DEFAULT_BASE_URL).rstrip("/")
 
     def _clean_messages(self, messages):
         # Clean and consolidate messages for the Perplexity API
         cleaned_messages = []
         last_role = None
         for message in messages:
+            # Copies, so merging user messages below never edits the chain's own history
             if message["role"] == "system":
-                cleaned_messages.append(message)
+                cleaned_messages.append(dict(message))
             elif message["role"] != last_role:
-                cleaned_messages.append(message)
+                cleaned_messages.append(dict(message))
                 last_role = message["role"]
             elif message["role"] == "user":
                 cleaned_messages[-1]["content"] += "\n" + message["content"]
@@ -25,35 +35,68 @@ class PerplexityHandler(BaseHandler):
             cleaned_messages.pop()  
         return cleaned_messages
 
+    def _headers(self):
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    def _raise_for_status(self, response):
+        # Works for both requests and httpx responses
+        if response.status_code == 400:
+            error_message = response.json().get("error", {}).get("message", "Unknown error")
+            raise BadRequestError(f"Bad request (400): {error_message}")
+        response.raise_for_status()
+
+    def _record_usage(self, data):
+        usage = data.get("usage") or {}
+        record_usage(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"))
+        choices = data.get("choices") or [{}]
+        record_finish_reason(choices[0].get("finish_reason"))
+
     def _make_request(self, messages, max_tokens):
         # Make a request to the Perplexity API
         cleaned_messages = self._clean_messages(messages)
 
-        url = "https://api.perplexity.ai/chat/completions"
+        url = f"{self.url}/chat/completions"
         payload = {"model": self.model, "messages": cleaned_messages}
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        try:
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
-        except requests.exceptions.HTTPError as http_err:
-            if response.status_code == 400:
-                error_message = response.json().get("error", {}).get("message", "Unknown error")
-                raise ValueError(f"Bad request (400): {error_message}")
-            raise  # Re-raise the exception if it's not a 400 error
-
-    def _process_response(self, response, is_final_answer):
-        # Process the Perplexity API response
-        try:
-            return super()._process_response(response, is_final_answer)
-        except json.JSONDecodeError:
-            print("Warning: content is not a valid JSON, returning raw response")
-            forced_final_answer = '"next_action": "final_answer"' in response.lower().strip()
-            return {
-                "title": "Raw Response",
-                "content": response,
-                "next_action": "final_answer" if (is_final_answer or forced_final_answer) else "continue"
-            }
\ No newline at end of file
+        response = get_session().post(url, json=payload, headers=self._headers(), timeout=get_timeout())
+        record_first_byte(response.elapsed.total_seconds())
+        self._raise_for_status(response)
+        data = response.json()
+        self._record_usage(data)
+        return data["choices"][0]["message"]["content"]
+
+    async def _amake_request(self, messages, max_tokens):
+        # Async request to the Perplexity API through the pooled httpx client
+        cleaned_messages = self._clean_messages(messages)
+
+        url = f"{self.url}/chat/completions"
+        payload = {"model": self.model, "messages": cleaned_messages}
+        response = await get_async_client().post(url, json=payload, headers=self._headers())
+        self._raise_for_status(response)
+        data = response.json()
+        self._record_usage(data)
+        return data["choices"][0]["message"]["content"]
+
+    def _make_stream_request(self, messages, max_tokens):
+        # Stream from the Perplexity API using server-sent events
+        cleaned_messages = self._clean_messages(messages)
+
+        url = f"{self.url}/chat/completions"
+        payload = {"model": self.model, "messages": cleaned_messages, "stream": True}
+        with get_session().post(url, json=payload, headers=self._headers(), stream=True, timeout=get_timeout()) as response:
+            self._raise_for_status(response)
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    # Keep reading to the end of the body so the connection goes back to the pool
+                    continue
+                event = json.loads(data)
+                if event.get("usage"):
+                    self._record_usage(event)
+                choices = event.get("choices") or [{}]
+                record_finish_reason(choices[0].get("finish_reason"))
+                yield (choices[0].get("delta") or {}).get("content") or ""
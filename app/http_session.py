@@ -0,0 +1,125 @@
+import asyncio
+import os
+import threading
+import weakref
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import record_first_byte
+
+# Process-wide pooled HTTP session shared by every handler instance.
+# Imported modules survive Streamlit reruns, so the pool (and its keep-alive
+# connections) is reused across reruns, sessions and reasoning steps.
+
+_session = None
+_session_lock = threading.Lock()
+
+# httpx async clients are bound to the event loop they were created on, so there is one per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return float(default)
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return int(default)
+
+
+def pool_config():
+    # Pool size and timeouts, configurable through the environment
+    return {
+        "pool_connections": _env_int("HTTP_POOL_CONNECTIONS", 10),
+        "pool_maxsize": _env_int("HTTP_POOL_MAXSIZE", 32),
+        "connect_timeout": _env_float("HTTP_CONNECT_TIMEOUT", 10),
+        "read_timeout": _env_float("HTTP_READ_TIMEOUT", 300),
+    }
+
+
+def get_timeout():
+    # (connect, read) timeout tuple for requests
+    config = pool_config()
+    return (config["connect_timeout"], config["read_timeout"])
+
+
+def _build_session(config):
+    session = requests.Session()
+    # Retries are handled by BaseHandler, so the adapter itself never retries
+    adapter = HTTPAdapter(
+        pool_connections=config["pool_connections"],
+        pool_maxsize=config["pool_maxsize"],
+        max_retries=0,
+        pool_block=False,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+def get_session():
+    # Return the shared session, creating it on first use
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session(pool_config())
+    return _session
+
+
+def reset_session():
+    # Close the pooled connections, e.g. after changing the pool configuration
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def _first_byte_hook(response):
+    # httpx "response" event hooks run as soon as the headers are in, in the caller's context
+    record_first_byte()
+
+
+async def _afirst_byte_hook(response):
+    record_first_byte()
+
+
+# Event hooks recording TTFB for httpx clients, including the ones inside provider SDKs
+FIRST_BYTE_HOOKS = {"response": [_first_byte_hook]}
+ASYNC_FIRST_BYTE_HOOKS = {"response": [_afirst_byte_hook]}
+
+
+def _build_async_client(config):
+    # httpx is only imported once something actually runs on an event loop
+    import httpx
+    return httpx.AsyncClient(
+        event_hooks=ASYNC_FIRST_BYTE_HOOKS,
+        limits=httpx.Limits(
+            max_connections=config["pool_maxsize"],
+            max_keepalive_connections=config["pool_maxsize"],
+        ),
+        timeout=httpx.Timeout(config["read_timeout"], connect=config["connect_timeout"]),
+    )
+
+
+def get_async_client():
+    # Return the pooled async client for the running event loop, creating it on first use
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _build_async_client(pool_config())
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_async_client():
+    # Close the running loop's pooled client, e.g. before shutting the loop down
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -1,27 +1,106 @@
+import atexit
 import logging
 import os
-from datetime import datetime
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import load_env_vars
+
+# Application logging. Records are put on a queue by the calling thread and
+# written by a background listener, so a slow disk or console never blocks a
+# request. The log file rotates by size instead of a new file per process.
+#
+# Configured from the environment:
+#   MULTI1_LOG_LEVEL      level of the multi1 logger (default INFO)
+#   MULTI1_LOG_FILE       log file path (default logs/multi1.log, "none" disables it)
+#   MULTI1_LOG_MAX_BYTES  rotate the file at this size (default 10 MB)
+#   MULTI1_LOG_BACKUPS    rotated files to keep (default 3)
+#   MULTI1_LOG_CONSOLE    also log to stderr (default on)
+#   MULTI1_LOG_MAX_CHARS  truncate longer messages, e.g. full responses (default 1000, 0 disables)
+#   MULTI1_LOG_SAMPLE     fraction of DEBUG records kept (default 1.0)
+# Changes take effect on the next process start.
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_LOG_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs', 'multi1.log')
+
+_listener = None
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+class TruncatingFilter(logging.Filter):
+    # Caps the message length so a full model response never ends up in the log
+    def __init__(self, max_chars):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def filter(self, record):
+        if self.max_chars:
+            message = record.getMessage()
+            if len(message) > self.max_chars:
+                record.msg = f"{message[:self.max_chars]}... [{len(message) - self.max_chars} more chars]"
+                record.args = None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    # Keeps only a fraction of the records below `max_level`
+    def __init__(self, rate, max_level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.max_level = max_level
+
+    def filter(self, record):
+        return record.levelno > self.max_level or self.rate >= 1 or random.random() < self.rate
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 
 def setup_logger():
-    # Create a logs directory if it doesn't exist
-    log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
-    os.makedirs(log_dir, exist_ok=True)
-
-    # Create a unique log file name based on the current timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_file = os.path.join(log_dir, f"multi1_{timestamp}.log")
-
-    # Configure the logger
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler()  # This will also print logs to console
-        ]
-    )
-
-    return logging.getLogger('multi1')
+    # Configure the multi1 logger once per process (Streamlit reruns reuse the module)
+    global _listener
+    logger = logging.getLogger('multi1')
+    if _listener is not None:
+        return logger
+
+    # The settings may come from .env, which is otherwise only read once the page renders
+    load_env_vars()
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    log_file = os.getenv('MULTI1_LOG_FILE', DEFAULT_LOG_FILE)
+    if log_file and log_file.lower() != 'none':
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        handlers.append(RotatingFileHandler(
+            log_file,
+            maxBytes=int(os.getenv('MULTI1_LOG_MAX_BYTES', 10 * 1024 * 1024)),
+            backupCount=int(os.getenv('MULTI1_LOG_BACKUPS', 3)),
+            encoding='utf-8',
+        ))
+    if _env_flag('MULTI1_LOG_CONSOLE', '1'):
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter(float(os.getenv('MULTI1_LOG_SAMPLE', 1.0))))
+    queue_handler.addFilter(TruncatingFilter(int(os.getenv('MULTI1_LOG_MAX_CHARS', 1000))))
+
+    logger.setLevel(os.getenv('MULTI1_LOG_LEVEL', 'INFO').upper())
+    logger.handlers = [queue_handler]
+    logger.propagate = False
+
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(_stop_listener)
+    return logger
 
 # Create a global logger instance
-logger = setup_logger()
\ No newline at end of file
+logger = setup_logger()
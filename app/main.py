@@ -1,19 +1,22 @@
 import streamlit as st
-from dotenv import load_dotenv
-from api_handlers import OllamaHandler, PerplexityHandler, GroqHandler
+from api_handlers import BACKENDS, get_handler
 from utils import generate_response, litellm_config, litellm_instructions
 from config_menu import config_menu, display_config
 from logger import logger
+from response_cache import get_response_cache
+from trace_store import get_trace_store
+from prompts import DEFAULT_PROMPT, PromptNotFoundError, get_prompt_registry
+from self_consistency import VOTING_METHODS, run_self_consistency
 import os
-from handlers.litellm_handler import LiteLLMHandler
 
-# Load environment variables from .env file
-load_dotenv()
+@st.cache_data
+def read_css():
+    with open(os.path.join(os.path.dirname(__file__), "..", "static", "styles.css")) as f:
+        return f.read()
 
 def load_css():
-    # Load custom CSS styles
-    with open(os.path.join(os.path.dirname(__file__), "..", "static", "styles.css")) as f:
-        st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+    # Load custom CSS styles (read from disk once per process)
+    st.markdown(f'<style>{read_css()}</style>', unsafe_allow_html=True)
 
 def setup_page():
     # Configure the Streamlit page
@@ -36,22 +39,59 @@ def setup_page():
     """, unsafe_allow_html=True)
 
 def get_api_handler(backend, config):
-    if backend == "Ollama":
-        return OllamaHandler(config['OLLAMA_URL'], config['OLLAMA_MODEL'])
-    elif backend == "Perplexity AI":
-        return PerplexityHandler(config['PERPLEXITY_API_KEY'], config['PERPLEXITY_MODEL'])
-    elif backend == "Groq":
-        return GroqHandler(config['GROQ_API_KEY'], config['GROQ_MODEL'])
-    else:  # LiteLLM
+    if backend == "LiteLLM":
+        # LiteLLM is configured in the session rather than in .env
         litellm_config = st.session_state.get('litellm_config', {})
-        return LiteLLMHandler(
-            litellm_config.get('model', ''),
-            litellm_config.get('api_base', ''),
-            litellm_config.get('api_key', '')
-        )
+        config = dict(config,
+                      LITELLM_MODEL=litellm_config.get('model', ''),
+                      LITELLM_API_BASE=litellm_config.get('api_base', ''),
+                      LITELLM_API_KEY=litellm_config.get('api_key', ''))
+    return get_handler(backend, config)
+
+class StepRenderer:
+    # Keeps one placeholder per step. Each yield from generate_response re-renders
+    # only the steps whose title or content changed (the new or still streaming one),
+    # instead of rebuilding the whole list
+    def __init__(self, container):
+        self.container = container
+        self.slots = []
+        self.rendered = []
+
+    def render(self, steps):
+        for index, (title, content, _) in enumerate(steps):
+            if index == len(self.slots):
+                self.slots.append(self.container.empty())
+                self.rendered.append(None)
+            if self.rendered[index] != (title, content):
+                self._render_step(self.slots[index], title, content)
+                self.rendered[index] = (title, content)
+
+    def _render_step(self, slot, title, content):
+        with slot.container():
+            if title.startswith("Final Answer"):
+                # Display the final answer
+                st.markdown(f'<h3 class="expander-title">🎯 {title}</h3>', unsafe_allow_html=True)
+                st.markdown(f'<div>{content}</div>', unsafe_allow_html=True)
+            else:
+                # Display intermediate steps
+                with st.expander(f"📝 {title}", expanded=True):
+                    st.markdown(f'<div>{content}</div>', unsafe_allow_html=True)
+
+def display_vote(result):
+    # Show the voted answer followed by the vote breakdown
+    st.markdown('<h3 class="expander-title">🎯 Final Answer</h3>', unsafe_allow_html=True)
+    st.markdown(f'<div>{result["answer"] or "No chain produced an answer."}</div>', unsafe_allow_html=True)
+    with st.expander(f"🗳️ Votes ({result['completed_chains']} of {result['requested_chains']} chains)", expanded=False):
+        for answer, weight in sorted(result["votes"].items(), key=lambda item: item[1], reverse=True):
+            st.markdown(f"- **{weight:g}**: {answer}")
+        if result["stopped_early"]:
+            st.caption("The vote was decided before every chain finished.")
+    st.markdown(f'<p class="thinking-time">⏱️ Total time: {result["total_time"]:.2f} seconds</p>', unsafe_allow_html=True)
+    logger.info("Self-consistency vote finished (%s, agreement %.0f%%, %d chains)",
+                result['method'], result['agreement'] * 100, result['completed_chains'])
 
 def main():
-    logger.info("Starting the application")
+    logger.debug("Rerunning the application")
     setup_page()
 
     # Set up the sidebar for configuration
@@ -59,7 +99,7 @@ def main():
     config = config_menu()
     
     # Allow user to select the AI backend   
-    backend = st.sidebar.selectbox("Choose AI Backend", ["LiteLLM", "Ollama", "Perplexity AI", "Groq"])
+    backend = st.sidebar.selectbox("Choose AI Backend", BACKENDS)
     
     if backend == "LiteLLM":
         litellm_instructions()
@@ -67,41 +107,72 @@ def main():
     else:
         display_config(backend, config)
     
+    # Pick a system prompt variant when more than the default one is available
+    prompt_names = sorted(get_prompt_registry().available(), key=lambda name: name != DEFAULT_PROMPT)
+    prompt_name = None
+    if len(prompt_names) > 1:
+        prompt_name = st.sidebar.selectbox("System prompt", prompt_names)
+
+    # Streaming renders each step token by token instead of waiting for the whole step
+    stream_steps = st.sidebar.checkbox("Stream steps as they are generated", value=True)
+
+    # Self-consistency runs several chains in parallel and votes on the final answer
+    samples = st.sidebar.number_input("Self-consistency chains", min_value=1, max_value=15, value=1)
+    vote_method = st.sidebar.selectbox("Vote", VOTING_METHODS) if samples > 1 else None
+
+    # Step budget: stop stepping early once the model is confident or a per-query limit is reached (0: off)
+    with st.sidebar.expander("Step budget"):
+        confidence_threshold = st.slider("Stop at confidence", min_value=0, max_value=100, value=0)
+        token_budget = st.number_input("Token budget per query", min_value=0, value=0, step=1000)
+        time_budget = st.number_input("Time budget per query (s)", min_value=0, value=0, step=10)
+    budget = {
+        "confidence_threshold": confidence_threshold or None,
+        "token_budget": token_budget or None,
+        "time_budget": time_budget or None,
+    }
+
+    # With a trace store, a query that already ran is replayed (or resumed) instead of paying for it again
+    resume = True
+    if get_trace_store() is not None:
+        resume = st.sidebar.checkbox("Reuse saved reasoning chains", value=True)
+
     api_handler = get_api_handler(backend, config)
-    logger.info(f"Selected backend: {backend}")
+    logger.debug("Selected backend: %s", backend)
+
+    cache = get_response_cache()
+    if cache is not None:
+        stats = cache.stats()
+        st.sidebar.caption(f"🗄️ Response cache: {stats['hits']} hits / {stats['misses']} misses")
 
     # User input field
     user_query = st.text_input("💬 Enter your query:", placeholder="e.g., How many 'R's are in the word strawberry?")
 
     if user_query:
-        logger.info(f"Received user query: {user_query}")
+        logger.info("Received user query (%d chars) for %s", len(user_query), backend)
         st.write("🔍 Generating response...")
-        response_container = st.empty()
+        renderer = StepRenderer(st.container())
         time_container = st.empty()
 
         try:
-            # Generate and display the response
-            for steps, total_thinking_time in generate_response(user_query, api_handler):
-                with response_container.container():
-                    for title, content, _ in steps:
-                        if title.startswith("Final Answer"):
-                            # Display the final answer
-                            st.markdown(f'<h3 class="expander-title">🎯 {title}</h3>', unsafe_allow_html=True)
-                            st.markdown(f'<div>{content}</div>', unsafe_allow_html=True)
-                            logger.info(f"Final answer generated: {content}")
-                        else:
-                            # Display intermediate steps
-                            with st.expander(f"📝 {title}", expanded=True):
-                                st.markdown(f'<div>{content}</div>', unsafe_allow_html=True)
-                            logger.debug(f"Step completed: {title}")
+            if samples > 1:
+                display_vote(run_self_consistency(user_query, api_handler, samples, vote_method,
+                                                  prompt_name=prompt_name, budget=budget))
+                return
+            # Generate and display the response; only new or growing steps are sent to the browser
+            for steps, total_thinking_time in generate_response(user_query, api_handler, stream=stream_steps, resume=resume,
+                                                                     prompt_name=prompt_name, budget=budget):
+                renderer.render(steps)
 
                 # Display total thinking time
                 if total_thinking_time is not None:
                     time_container.markdown(f'<p class="thinking-time">⏱️ Total thinking time: {total_thinking_time:.2f} seconds</p>', unsafe_allow_html=True)
-                    logger.info(f"Total thinking time: {total_thinking_time:.2f} seconds")
+                    logger.info("Response completed in %.2f seconds over %d steps", total_thinking_time, len(steps))
+        except PromptNotFoundError as e:
+            logger.error("System prompt unavailable: %s", e)
+            st.error(f"The system prompt could not be loaded: {e}")
         except Exception as e:
             # Handle and display any errors
-            logger.error(f"Error generating response: {str(e)}", exc_info=True)
+            logger.error("Error generating response: %s", e, exc_info=True)
             st.error("An error occurred while generating the response. Please try again.")
 
 if __name__ == "__main__":
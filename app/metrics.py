@@ -0,0 +1,310 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Per-call instrumentation for handler API calls.
+#
+# Every make_api_call / amake_api_call / stream_api_call produces one CallRecord
+# (latency, time to first byte, attempts, token counts, parse failures, ...)
+# that is passed to the configured sinks. Handlers report provider-specific
+# details (token usage, TTFB) through the module-level helpers below, which
+# write to the record of the call currently in progress.
+#
+# Sinks are configured from the environment:
+#   MULTI1_METRICS_PORT  serve Prometheus text format on http://0.0.0.0:<port>/metrics
+#   MULTI1_TRACE_FILE    append every call record to a JSONL trace file
+
+_current_call = contextvars.ContextVar("multi1_current_call", default=None)
+_current_step = contextvars.ContextVar("multi1_current_step", default=None)
+_last_call = contextvars.ContextVar("multi1_last_call", default=None)
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class CallRecord:
+    def __init__(self, backend, model, is_final_answer):
+        self.backend = backend
+        self.model = model
+        self.kind = "final_answer" if is_final_answer else "step"
+        self.step = _current_step.get()
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._attempt_start = self._start
+        self.ttfb = None
+        self.latency = None
+        self.attempts = 0
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.parse_failures = 0
+        self.parse_method = None
+        self.cache_hit = False
+        self.outcome = None
+        self.error = None
+        self.extra = {}
+
+    @property
+    def retries(self):
+        return max(0, self.attempts - 1)
+
+    def start_attempt(self):
+        # A new attempt: TTFB is measured from here and reported for the last attempt only
+        self.attempts += 1
+        self._attempt_start = time.perf_counter()
+        self.ttfb = None
+        self.extra.pop("finish_reason", None)
+
+    def mark_first_byte(self, seconds=None):
+        # Time to first byte of the current attempt; measured now unless given
+        self.ttfb = seconds if seconds is not None else time.perf_counter() - self._attempt_start
+
+    def finish(self, step):
+        self.latency = time.perf_counter() - self._start
+        if step.get("error"):
+            self.outcome = "error"
+            self.error = step.get("content")
+        else:
+            self.outcome = "cache_hit" if self.cache_hit else "ok"
+
+    def to_dict(self):
+        record = {
+            "timestamp": self.started,
+            "backend": self.backend,
+            "model": self.model,
+            "kind": self.kind,
+            "step": self.step,
+            "outcome": self.outcome,
+            "latency": self.latency,
+            "ttfb": self.ttfb,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "parse_failures": self.parse_failures,
+            "parse_method": self.parse_method,
+            "error": self.error,
+        }
+        record.update(self.extra)
+        return record
+
+
+def current_call():
+    return _current_call.get()
+
+
+def last_call():
+    # Record of the most recent call made from this thread or task, once it has finished
+    return _last_call.get()
+
+
+def set_last_call(record):
+    # Hand the record of a call made in another context (e.g. a worker thread) to this one
+    _last_call.set(record)
+
+
+def set_current_step(label):
+    # Label (e.g. "Step 3") attached to the calls made for the step being generated
+    _current_step.set(label)
+
+
+def record_first_byte(seconds=None):
+    call = _current_call.get()
+    if call is not None:
+        call.mark_first_byte(seconds)
+
+
+def record_usage(prompt_tokens=None, completion_tokens=None, **extra):
+    # Token counts as reported by the provider, plus any provider-specific fields
+    call = _current_call.get()
+    if call is None:
+        return
+    if prompt_tokens is not None:
+        call.prompt_tokens = prompt_tokens
+    if completion_tokens is not None:
+        call.completion_tokens = completion_tokens
+    call.extra.update({key: value for key, value in extra.items() if value is not None})
+
+
+def record_finish_reason(reason):
+    # Why generation stopped ("stop", "length", ...); "length" means the output hit max_tokens
+    call = _current_call.get()
+    if call is not None and reason:
+        call.extra["finish_reason"] = str(reason)
+
+
+def record_parse_failure():
+    call = _current_call.get()
+    if call is not None:
+        call.parse_failures += 1
+
+
+def record_parse(method):
+    # How the step was recovered from the model output (see step_parser.PARSE_METHODS)
+    call = _current_call.get()
+    if call is None:
+        return
+    call.parse_method = method
+    if method == "raw":
+        call.parse_failures += 1
+
+
+class JsonlTraceSink:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record.to_dict(), ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusSink:
+    # Aggregates call records into counters and a latency histogram rendered in
+    # the Prometheus text exposition format
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def _inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+    def emit(self, record):
+        labels = {"backend": record.backend, "kind": record.kind}
+        with self._lock:
+            self._inc("multi1_calls_total", dict(labels, outcome=record.outcome))
+            self._inc("multi1_retries_total", labels, record.retries)
+            self._inc("multi1_parse_failures_total", labels, record.parse_failures)
+            if record.parse_method is not None:
+                self._inc("multi1_step_parse_total", dict(labels, method=record.parse_method))
+            if record.prompt_tokens is not None:
+                self._inc("multi1_prompt_tokens_total", labels, record.prompt_tokens)
+            if record.completion_tokens is not None:
+                self._inc("multi1_completion_tokens_total", labels, record.completion_tokens)
+            if record.latency is not None and not record.cache_hit:
+                self._observe("multi1_call_latency_seconds", labels, record.latency)
+            if record.ttfb is not None:
+                self._observe("multi1_call_ttfb_seconds", labels, record.ttfb)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                label_text = ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels)
+                lines.append(f"{name}{{{label_text}}} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                label_text = ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels)
+                separator = "," if label_text else ""
+                for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                    lines.append(f'{name}_bucket{{{label_text}{separator}le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{label_text}{separator}le="+Inf"}} {histogram["count"]}')
+                lines.append(f"{name}_sum{{{label_text}}} {histogram['sum']}")
+                lines.append(f"{name}_count{{{label_text}}} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        # Expose /metrics from a background thread
+        sink = self
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = sink.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class Metrics:
+    def __init__(self):
+        self.sinks = []
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        with self._lock:
+            self.sinks.append(sink)
+        return sink
+
+    def sink_of_type(self, sink_type):
+        for sink in self.sinks:
+            if isinstance(sink, sink_type):
+                return sink
+        return None
+
+    @contextmanager
+    def track_call(self, backend, model, is_final_answer):
+        # Make a CallRecord current for the duration of one handler call, then emit it
+        record = CallRecord(backend, model, is_final_answer)
+        token = _current_call.set(record)
+        try:
+            yield record
+        finally:
+            _current_call.reset(token)
+            if record.latency is None:
+                record.latency = time.perf_counter() - record._start
+                record.outcome = record.outcome or "exception"
+            _last_call.set(record)
+            self.emit(record)
+
+    def emit(self, record):
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception:
+                # Instrumentation must never break a reasoning chain
+                pass
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    # Process-wide metrics, with sinks configured from the environment on first use
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                metrics = Metrics()
+                trace_file = os.getenv("MULTI1_TRACE_FILE")
+                if trace_file:
+                    metrics.add_sink(JsonlTraceSink(trace_file))
+                port = os.getenv("MULTI1_METRICS_PORT")
+                if port:
+                    metrics.add_sink(PrometheusSink()).serve(int(port))
+                _metrics = metrics
+    return _metrics
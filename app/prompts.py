@@ -0,0 +1,107 @@
+import os
+import re
+import threading
+import time
+
+# Registry of system prompt templates, loaded once and kept in memory.
+#
+# app/system_prompt.txt is the "default" prompt. Named, versioned variants
+# live in app/prompts/ as <name>.txt or <name>.v<version>.txt, e.g.
+# concise.v2.txt; asking for a name without a version gives its latest one.
+# Files are re-read only when their mtime changes, checked at most every
+# `check_interval` seconds, so the reasoning loop never touches the disk.
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PROMPT_PATH = os.path.join(APP_DIR, "system_prompt.txt")
+PROMPTS_DIR = os.path.join(APP_DIR, "prompts")
+DEFAULT_PROMPT = "default"
+
+_VARIANT_PATTERN = re.compile(r"^(?P<name>[\w-]+?)(?:\.v(?P<version>\d+))?\.txt$")
+
+
+class PromptNotFoundError(Exception):
+    pass
+
+
+class PromptRegistry:
+    def __init__(self, default_path=DEFAULT_PROMPT_PATH, prompts_dir=PROMPTS_DIR, check_interval=2.0):
+        self.default_path = default_path
+        self.prompts_dir = prompts_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._prompts = {}  # (name, version) -> (path, mtime, text)
+        self._last_check = 0
+        self.refresh()
+
+    def _discover(self):
+        # Map (name, version) to file path; the version is 0 for unversioned files
+        paths = {}
+        if os.path.isfile(self.default_path):
+            paths[(DEFAULT_PROMPT, 0)] = self.default_path
+        if os.path.isdir(self.prompts_dir):
+            for filename in os.listdir(self.prompts_dir):
+                match = _VARIANT_PATTERN.match(filename)
+                if match:
+                    version = int(match.group("version") or 0)
+                    paths[(match.group("name"), version)] = os.path.join(self.prompts_dir, filename)
+        return paths
+
+    def refresh(self):
+        # Reload prompts whose file changed, drop deleted ones and pick up new ones
+        with self._lock:
+            prompts = {}
+            for key, path in self._discover().items():
+                try:
+                    mtime = os.path.getmtime(path)
+                    cached = self._prompts.get(key)
+                    if cached and cached[0] == path and cached[1] == mtime:
+                        prompts[key] = cached
+                        continue
+                    with open(path, "r") as file:
+                        prompts[key] = (path, mtime, file.read())
+                except OSError:
+                    continue
+            self._prompts = prompts
+            self._last_check = time.monotonic()
+
+    def _maybe_refresh(self):
+        if time.monotonic() - self._last_check >= self.check_interval:
+            self.refresh()
+
+    def get(self, name=None, version=None):
+        # Return the prompt text for a name and optional version (latest by default)
+        self._maybe_refresh()
+        name = name or DEFAULT_PROMPT
+        with self._lock:
+            versions = sorted(v for n, v in self._prompts if n == name)
+            if not versions:
+                raise PromptNotFoundError(f"Prompt '{name}' not found")
+            if version is None:
+                version = versions[-1]
+            entry = self._prompts.get((name, int(version)))
+        if entry is None:
+            raise PromptNotFoundError(f"Prompt '{name}' has no version {version}")
+        return entry[2]
+
+    def available(self):
+        # {name: [versions]} of every loaded prompt
+        self._maybe_refresh()
+        with self._lock:
+            names = {}
+            for name, version in sorted(self._prompts):
+                names.setdefault(name, []).append(version)
+        return names
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry():
+    # Process-wide registry, created on first use
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = PromptRegistry()
+    return _registry
@@ -0,0 +1,119 @@
+import importlib
+import os
+import threading
+
+# Registry of the backends a handler can be built for. Providers are recorded
+# as "module:Class" strings and only imported on first use, so starting the app
+# never pays for SDKs (litellm, groq, pydantic, ...) that are not used.
+#
+# Providers come from three places, in this order:
+#   built-in       BUILTIN_PROVIDERS below
+#   naming         app/handlers/<name>_handler.py defining <Name>Handler
+#                  (e.g. your_provider_handler.py -> YourProviderHandler, backend "YourProvider")
+#   entry points   installed packages declaring
+#                  [project.entry-points."multi1.providers"]
+#                  "My Backend" = "my_package.handler:MyHandler"
+# Providers other than the built-in ones are built with Handler.from_config(config).
+
+BUILTIN_PROVIDERS = {
+    "LiteLLM": "handlers.litellm_handler:LiteLLMHandler",
+    "Ollama": "handlers.ollama_handler:OllamaHandler",
+    "Perplexity AI": "handlers.perplexity_handler:PerplexityHandler",
+    "Groq": "handlers.groq_handler:GroqHandler",
+    "Composite": "handlers.composite_handler:CompositeHandler",
+}
+ENTRY_POINT_GROUP = "multi1.providers"
+HANDLERS_DIR = os.path.join(os.path.dirname(__file__), "handlers")
+
+_providers = None
+_loaded = {}
+_lock = threading.Lock()
+
+
+def _camel_case(name):
+    return "".join(part[:1].upper() + part[1:] for part in name.split("_"))
+
+
+def _convention_providers():
+    # Handler modules in app/handlers/ that are not built in, found by file name without importing them
+    builtin_modules = {target.split(":")[0] for target in BUILTIN_PROVIDERS.values()}
+    providers = {}
+    try:
+        filenames = sorted(os.listdir(HANDLERS_DIR))
+    except OSError:
+        return providers
+    for filename in filenames:
+        if not filename.endswith("_handler.py"):
+            continue
+        module = f"handlers.{filename[:-3]}"
+        if module not in builtin_modules:
+            name = _camel_case(filename[:-len("_handler.py")])
+            providers[name] = f"{module}:{name}Handler"
+    return providers
+
+
+def _entry_point_providers():
+    from importlib.metadata import entry_points
+    try:
+        return {entry_point.name: entry_point.value for entry_point in entry_points(group=ENTRY_POINT_GROUP)}
+    except Exception:
+        # A broken installed distribution must not take the app down
+        return {}
+
+
+def providers():
+    # Backend name -> "module:Class", discovered once per process
+    global _providers
+    if _providers is None:
+        with _lock:
+            if _providers is None:
+                found = dict(BUILTIN_PROVIDERS)
+                for name, target in list(_convention_providers().items()) + list(_entry_point_providers().items()):
+                    found.setdefault(name, target)
+                _providers = found
+    return _providers
+
+
+def available_providers():
+    return list(providers())
+
+
+def is_builtin(name):
+    return name in BUILTIN_PROVIDERS
+
+
+def _import_target(target):
+    module_name, _, class_name = target.partition(":")
+    module = importlib.import_module(module_name)
+    handler_class = getattr(module, class_name, None)
+    if handler_class is None:
+        # Naming convention miss: fall back to the one handler class defined in the module
+        from api_handlers import BaseHandler
+        candidates = [value for value in vars(module).values()
+                      if isinstance(value, type) and issubclass(value, BaseHandler)
+                      and value is not BaseHandler and value.__module__ == module.__name__]
+        if len(candidates) != 1:
+            raise ImportError(f"{module_name} does not define {class_name}")
+        handler_class = candidates[0]
+    return handler_class
+
+
+def load_provider(name):
+    # Handler class for a backend, importing its module (and SDK) on first use
+    handler_class = _loaded.get(name)
+    if handler_class is not None:
+        return handler_class
+    target = providers().get(name)
+    if target is None:
+        raise ValueError(f"Unknown backend: {name}")
+    handler_class = _import_target(target)
+    _loaded[name] = handler_class
+    return handler_class
+
+
+def provider_for_class(class_name):
+    # Backend name of a built-in handler class name (e.g. "GroqHandler"), for lazy attribute access
+    for name, target in BUILTIN_PROVIDERS.items():
+        if target.endswith(f":{class_name}"):
+            return name
+    return None
@@ -0,0 +1,239 @@
+import json
+import logging
+import time
+from budget import StepBudget, budget_from_env
+from context import ContextCompactor, compactor_from_env, estimate_tokens
+from metrics import last_call, set_current_step
+from prompts import get_prompt_registry
+from stream_parser import StreamingStepParser
+from trace_store import open_tracer
+
+logger = logging.getLogger('multi1')
+
+FINAL_ANSWER_REQUEST = "Please provide the final answer based on your reasoning above."
+INITIAL_ASSISTANT_MESSAGE = "Understood. I will now create a detailed reasoning chain following the given instructions, starting with a thorough problem decomposition."
+
+
+class ReasoningChain:
+    # State of a single reasoning chain, independent of how the API calls are made.
+    # The sync and async drivers below ask it for the next call and feed back each result.
+
+    def __init__(self, prompt, max_steps=10, step_max_tokens=300, final_max_tokens=200,
+                 prompt_name=None, prompt_version=None, compaction=None, budget=None):
+        self.prompt = prompt
+
+        # Step budget: a StepBudget for this chain only, or a dict of StepBudget options
+        # (e.g. {"confidence_threshold": 90, "token_budget": 8000}) on top of the environment
+        if not isinstance(budget, StepBudget):
+            budget = budget_from_env(max_steps=max_steps, step_max_tokens=step_max_tokens,
+                                     final_max_tokens=final_max_tokens, **(budget or {}))
+        self.budget = budget
+        self.max_steps = budget.max_steps
+        self.stop_reason = None
+
+        # Initialize the conversation with system prompt, user input, and an initial assistant response
+        self.messages = [
+            {"role": "system", "content": get_prompt_registry().get(prompt_name, prompt_version)},
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": INITIAL_ASSISTANT_MESSAGE},
+        ]
+        self.steps = []
+        self.step_data = []
+        self.step_count = 1
+        self.total_thinking_time = 0
+        self.awaiting_final_answer = False
+        self.finished = False
+
+        # Context compaction: a ContextCompactor, a strategy string, or None for the environment default
+        if compaction is None:
+            compaction = compactor_from_env()
+        elif isinstance(compaction, str):
+            compaction = ContextCompactor(compaction)
+        self.compactor = compaction
+        self.prefix_length = len(self.messages)
+        self.context_stats = {"calls": 0, "full_tokens": 0, "sent_tokens": 0}
+        self.call_stats = []
+
+    def require_stable_prefix(self):
+        # Handlers relying on prefix caching need every earlier message resent unchanged
+        if not self.compactor.prefix_stable:
+            logger.warning("Context compaction that rewrites earlier steps is disabled for prefix caching")
+            self.compactor = self.compactor.stable_variant()
+
+    def next_call(self):
+        # Arguments for the next API call as (messages, max_tokens, is_final_answer), or None when done
+        if self.finished:
+            return None
+        messages = self._context()
+        if self.awaiting_final_answer:
+            return messages, self.budget.final_tokens(), True
+        return messages, self.budget.step_tokens(), False
+
+    def _context(self):
+        # The history to send, compacted if configured; token savings are tracked either way
+        messages = self.compactor.compact(self.messages, self.prefix_length)
+        self.context_stats["calls"] += 1
+        self.context_stats["full_tokens"] += estimate_tokens(self.messages)
+        self.context_stats["sent_tokens"] += estimate_tokens(messages)
+        return messages
+
+    def context_savings(self):
+        # Estimated prompt tokens saved by compaction over the whole chain
+        stats = dict(self.context_stats)
+        stats["saved_tokens"] = stats["full_tokens"] - stats["sent_tokens"]
+        stats["saved_ratio"] = stats["saved_tokens"] / stats["full_tokens"] if stats["full_tokens"] else 0.0
+        return stats
+
+    def next_title(self):
+        # Title prefix of the step currently being generated
+        return "Final Answer" if self.awaiting_final_answer else f"Step {self.step_count}"
+
+    def record(self, step_data, thinking_time, call=None):
+        # Store the result of the call returned by next_call, with its metrics record if available
+        self.add_step(step_data, thinking_time, call.to_dict() if call is not None else None)
+
+    def add_step(self, step_data, thinking_time, call_stats=None):
+        # Store a step with its metrics record as a dict; also used to restore steps from a trace
+        self.total_thinking_time += thinking_time
+        self.step_data.append(step_data)
+        self.call_stats.append(call_stats)
+        self.budget.observe(step_data, thinking_time, call_stats)
+
+        if self.awaiting_final_answer:
+            self.steps.append(("Final Answer", step_data.get("content", ""), thinking_time))
+            self._finish()
+            return
+
+        # Store each step's information
+        # Handlers return validated steps, but custom handlers and old cache entries may lack keys
+        title = step_data.get("title", "Untitled step")
+        self.steps.append((f"Step {self.step_count}: {title}", step_data.get("content", ""), thinking_time))
+
+        # A failed step ends the chain; asking for a final answer would only spend more calls
+        if step_data.get("error"):
+            self.stop_reason = "error"
+            self._finish()
+            return
+
+        # Add the assistant's response to the conversation
+        self.messages.append({"role": "assistant", "content": json.dumps(step_data)})
+        next_action = str(step_data.get("next_action", "continue")).lower().strip()
+        logger.debug("Next reasoning step: %s", next_action)
+
+        # Request the final answer if the model asks for it or the budget says to stop:
+        # step limit, a confident or repeated step, or the token/time budget running out
+        stop_reason = "final_answer" if next_action == "final_answer" else self.budget.stop_reason(step_data, self.step_count)
+        if stop_reason:
+            if stop_reason != "final_answer":
+                logger.info("Stopping after step %d: %s", self.step_count, stop_reason)
+            self.stop_reason = stop_reason
+            self.messages.append({"role": "user", "content": FINAL_ANSWER_REQUEST})
+            self.awaiting_final_answer = True
+        else:
+            self.step_count += 1
+
+    def _finish(self):
+        self.finished = True
+        if self.compactor.enabled:
+            savings = self.context_savings()
+            logger.info(f"Context compaction saved ~{savings['saved_tokens']} of {savings['full_tokens']} prompt tokens "
+                        f"({savings['saved_ratio']:.0%}) over {savings['calls']} calls")
+
+    def result(self):
+        # Value yielded to callers: the steps so far and the total time once finished
+        return self.steps, self.total_thinking_time if self.finished else None
+
+
+def _stream_step(api_handler, chain, messages, max_tokens, is_final_answer):
+    # Stream a single step, yielding the completed steps plus the partial one as it grows.
+    # The partial step has no thinking time yet; the processed step is the return value.
+    parser = StreamingStepParser()
+    title_prefix = chain.next_title()
+    call = api_handler.stream_api_call(messages, max_tokens, is_final_answer=is_final_answer)
+    while True:
+        try:
+            chunk = next(call)
+        except StopIteration as stop:
+            return stop.value
+        partial = parser.feed(chunk)
+        if is_final_answer:
+            title = title_prefix
+        else:
+            title = f"{title_prefix}: {partial.get('title', '...')}"
+        yield chain.steps + [(title, partial.get("content", ""), None)], None
+
+
+def _restore(chain, tracer):
+    # Steps of an earlier run of the same chain from the trace store, yielded like new ones
+    if tracer is None:
+        return
+    for step_data, thinking_time, call_stats in tracer.stored_steps():
+        chain.add_step(step_data, thinking_time, call_stats)
+        yield chain.result()
+    if chain.finished:
+        tracer.finish()
+
+
+def generate_response(prompt, api_handler, stream=False, chain=None, resume=True, **chain_options):
+    # Run a reasoning chain, yielding (steps, total_thinking_time) after every step.
+    # total_thinking_time stays None until the final answer is in.
+    # With a trace store (MULTI1_TRACE_DB) every step is checkpointed; unless resume
+    # is False, a finished run of the same chain is replayed and an interrupted one resumed.
+    # Extra keyword arguments (e.g. prompt_name) are passed on to ReasoningChain.
+    chain = chain or ReasoningChain(prompt, **chain_options)
+    if getattr(api_handler, "requires_stable_prefix", False):
+        chain.require_stable_prefix()
+    tracer = open_tracer(chain, api_handler, resume)
+    try:
+        yield from _restore(chain, tracer)
+        while True:
+            call = chain.next_call()
+            if call is None:
+                break
+            messages, max_tokens, is_final_answer = call
+
+            # Measure time taken for each API call
+            set_current_step(chain.next_title())
+            start_time = time.time()
+            if stream:
+                step_data = yield from _stream_step(api_handler, chain, messages, max_tokens, is_final_answer)
+            else:
+                step_data = api_handler.make_api_call(messages, max_tokens, is_final_answer=is_final_answer)
+            chain.record(step_data, time.time() - start_time, last_call())
+            if tracer is not None:
+                tracer.checkpoint()
+
+            yield chain.result()
+    finally:
+        # Also reached when the caller stops early (rerun, disconnect), so the chain can be resumed
+        if tracer is not None:
+            tracer.release()
+
+
+async def agenerate_response(prompt, api_handler, chain=None, resume=True, **chain_options):
+    # Async version of generate_response, so many chains can share one event loop.
+    # Trace store reads and writes are small local SQLite operations done inline.
+    chain = chain or ReasoningChain(prompt, **chain_options)
+    if getattr(api_handler, "requires_stable_prefix", False):
+        chain.require_stable_prefix()
+    tracer = open_tracer(chain, api_handler, resume)
+    try:
+        for result in _restore(chain, tracer):
+            yield result
+        while True:
+            call = chain.next_call()
+            if call is None:
+                break
+            messages, max_tokens, is_final_answer = call
+
+            set_current_step(chain.next_title())
+            start_time = time.time()
+            step_data = await api_handler.amake_api_call(messages, max_tokens, is_final_answer=is_final_answer)
+            chain.record(step_data, time.time() - start_time, last_call())
+            if tracer is not None:
+                tracer.checkpoint()
+
+            yield chain.result()
+    finally:
+        if tracer is not None:
+            tracer.release()
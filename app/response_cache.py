@@ -0,0 +1,198 @@
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Content-addressed cache for reasoning steps. Keys hash everything that
+# determines a response (handler, model, temperature, max_tokens, messages),
+# so an identical conversation prefix is answered without a model call.
+# Entries live in an in-memory LRU tier backed by an optional on-disk tier.
+
+# Index of the independent sample being generated (self-consistency runs the
+# same conversation several times); each sample gets its own cache entries
+_sample = contextvars.ContextVar("multi1_cache_sample", default=None)
+
+
+def set_cache_sample(index):
+    _sample.set(index)
+
+
+def cache_sample():
+    return _sample.get()
+
+
+# Version of the cached value layout ({"step", "completion_tokens"}); part of every
+# key, so entries written in an older layout are never read back
+CACHE_FORMAT = 2
+
+
+def cache_key(params, messages, max_tokens, is_final_answer):
+    sample = _sample.get()
+    if sample is not None:
+        params = dict(params, sample=sample)
+    payload = json.dumps(
+        [CACHE_FORMAT, params, max_tokens, is_final_answer, messages],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, ttl=7 * 24 * 3600, disk_dir=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _expired(self, created):
+        return self.ttl is not None and time.time() - created > self.ttl
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if self._expired(entry["created"]):
+            self.counters["expired"] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry["created"], entry["value"]
+
+    def _write_disk(self, key, created, value):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so concurrent readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"created": created, "value": value}, file)
+        os.replace(tmp_path, path)
+        self._disk_writes += 1
+        if self._disk_writes % 100 == 0:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        # Drop expired entries, then the oldest ones above the size limit
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        entries.append((os.path.getmtime(path), path))
+                    except OSError:
+                        pass
+        entries.sort()
+        now = time.time()
+        excess = len(entries) - self.max_disk_entries
+        for index, (mtime, path) in enumerate(entries):
+            if index >= excess and (self.ttl is None or now - mtime <= self.ttl):
+                continue
+            try:
+                os.remove(path)
+                self.counters["evictions"] += 1
+            except OSError:
+                pass
+
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def get(self, key):
+        # Return a fresh copy of the cached value, or None on a miss
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._expired(entry[0]):
+                del self._memory[key]
+                self.counters["expired"] += 1
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+            elif self.disk_dir:
+                entry = self._read_disk(key)
+                if entry is not None:
+                    self._remember(key, *entry)
+                    self.counters["disk_hits"] += 1
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            return json.loads(entry[1])
+
+    def set(self, key, value):
+        # Values are stored serialized so callers can't mutate cached entries
+        serialized = json.dumps(value, ensure_ascii=False)
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, serialized)
+            if self.disk_dir:
+                try:
+                    self._write_disk(key, created, serialized)
+                except OSError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters, entries=len(self._memory))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache_enabled():
+    return os.getenv("MULTI1_CACHE", "").lower() in ("1", "true", "yes", "on")
+
+
+def get_response_cache():
+    # Process-wide cache configured from the environment, or None when disabled
+    global _cache
+    if not cache_enabled():
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = float(os.getenv("MULTI1_CACHE_TTL", 7 * 24 * 3600))
+                _cache = ResponseCache(
+                    max_entries=int(os.getenv("MULTI1_CACHE_SIZE", 1024)),
+                    ttl=ttl if ttl > 0 else None,
+                    disk_dir=os.getenv("MULTI1_CACHE_DIR") or None,
+                    max_disk_entries=int(os.getenv("MULTI1_CACHE_DISK_SIZE", 100000)),
+                )
+    return _cache
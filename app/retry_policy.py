@@ -0,0 +1,194 @@
+import json
+import random
+import threading
+import time
+from collections import namedtuple
+from email.utils import parsedate_to_datetime
+
+# Retry policy shared by all handlers: classifies errors as retryable or fatal,
+# honors Retry-After, backs off exponentially with jitter and keeps a circuit
+# breaker per backend so a provider that is down fails fast.
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504, 529}
+
+ErrorClassification = namedtuple("ErrorClassification", ["retryable", "provider_failure", "retry_after"])
+
+
+class BadRequestError(ValueError):
+    # The provider rejected the request itself; sending it again will not help
+    pass
+
+
+class TruncatedResponseError(Exception):
+    # The model stopped at max_tokens; the step (possibly repaired) is kept in case no retry is left
+    def __init__(self, step, max_tokens):
+        super().__init__(f"Response cut off at max_tokens={max_tokens}")
+        self.step = step
+
+
+class CircuitOpenError(Exception):
+    # Raised instead of calling a provider whose circuit breaker is open
+    pass
+
+
+def _status_code(exc):
+    status = getattr(exc, "status_code", None)
+    if isinstance(status, int):
+        return status
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def parse_retry_after(value):
+    # Retry-After is either a number of seconds or an HTTP date
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _retry_after(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return parse_retry_after(headers.get("retry-after"))
+    except AttributeError:
+        return None
+
+
+# Class names (anywhere in the MRO) of connection-level errors raised by the
+# standard library, requests, httpx and the provider SDKs, matched by name so
+# none of those libraries has to be imported here
+NETWORK_ERROR_NAMES = {
+    "ConnectionError", "TimeoutError", "Timeout", "ChunkedEncodingError",
+    "TransportError", "TimeoutException", "NetworkError",
+    "APIConnectionError", "APITimeoutError",
+}
+
+
+def _is_network_error(exc):
+    return any(cls.__name__ in NETWORK_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def classify_error(exc):
+    if isinstance(exc, CircuitOpenError):
+        return ErrorClassification(False, False, None)
+    if isinstance(exc, TruncatedResponseError):
+        # Worth asking again with more room; the provider is healthy
+        return ErrorClassification(True, False, None)
+    if isinstance(exc, json.JSONDecodeError):
+        # Malformed model output: worth another sample, but the provider is healthy
+        return ErrorClassification(True, False, None)
+    status = _status_code(exc)
+    if status is not None:
+        if status in RETRYABLE_STATUS_CODES:
+            return ErrorClassification(True, True, _retry_after(exc))
+        if 400 <= status < 500:
+            return ErrorClassification(False, False, None)
+        return ErrorClassification(True, True, _retry_after(exc))
+    if isinstance(exc, BadRequestError):
+        return ErrorClassification(False, False, None)
+    if _is_network_error(exc):
+        return ErrorClassification(True, True, None)
+    if type(exc).__name__ == "RateLimitError":
+        return ErrorClassification(True, True, _retry_after(exc))
+    if type(exc).__name__ in ("AuthenticationError", "PermissionDeniedError", "NotFoundError", "BadRequestError"):
+        return ErrorClassification(False, False, None)
+    # Unknown errors (e.g. unexpected response shapes) keep the old retry behaviour
+    return ErrorClassification(True, False, None)
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=20.0, multiplier=2.0, max_retry_after=60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.max_retry_after = max_retry_after
+
+    def backoff(self, attempt):
+        # Exponential backoff with full jitter; attempt is 0 for the first retry
+        ceiling = min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+        return random.uniform(0, ceiling)
+
+    def next_delay(self, classification, attempt):
+        # Seconds to wait before the next attempt, or None to give up
+        if not classification.retryable or attempt + 1 >= self.max_attempts:
+            return None
+        if classification.retry_after is not None:
+            if classification.retry_after > self.max_retry_after:
+                return None
+            # Small jitter on top so clients throttled together don't return together
+            return classification.retry_after + random.uniform(0, self.base_delay)
+        return self.backoff(attempt)
+
+
+class CircuitBreaker:
+    # Opens after `failure_threshold` consecutive provider failures; after
+    # `reset_timeout` seconds one trial call is let through (half-open).
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open after {self.failures} consecutive failures)")
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        # The trial call ended without telling us anything about the provider (e.g. a fatal 4xx)
+        with self._lock:
+            self._trial_in_flight = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name):
+    # One breaker per backend, shared by every handler instance and session
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
@@ -0,0 +1,154 @@
+import asyncio
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from reasoning import ReasoningChain, agenerate_response, generate_response
+from response_cache import set_cache_sample
+
+# Self-consistency: run K reasoning chains for the same query concurrently and
+# vote on their final answers. Votes are either one per chain ("majority") or
+# weighted by the chain's confidence ("confidence"). Once no remaining chain
+# could change the winner, the outstanding chains are stopped. Each chain is
+# cached as a separate sample so the response cache does not collapse them
+# into one answer.
+
+VOTING_METHODS = ("majority", "confidence")
+DEFAULT_CONFIDENCE = 50
+
+_MARKUP = re.compile(r"[*_`#>]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_answer(text):
+    # Answers that differ only in case, markup, spacing or trailing punctuation vote together
+    text = _MARKUP.sub("", str(text)).lower()
+    return _WHITESPACE.sub(" ", text).strip().rstrip(".!").strip()
+
+
+def chain_confidence(chain):
+    # Confidence of the final answer, or the mean over the steps that report one
+    values = []
+    for step in chain.step_data:
+        try:
+            values.append(min(100, max(0, int(step["confidence"]))))
+        except (KeyError, TypeError, ValueError):
+            continue
+    final = chain.step_data[-1] if chain.step_data else {}
+    if "confidence" in final and values:
+        return values[-1]
+    return sum(values) / len(values) if values else DEFAULT_CONFIDENCE
+
+
+class Vote:
+    def __init__(self, k, method="majority"):
+        if method not in VOTING_METHODS:
+            raise ValueError(f"Unknown voting method: {method}")
+        self.k = k
+        self.method = method
+        self.tally = defaultdict(float)
+        self.examples = {}
+        self.chains = []
+
+    @property
+    def max_weight(self):
+        return 1 if self.method == "majority" else 100
+
+    def add(self, chain):
+        # Count a finished chain; chains that ended in an error do not vote
+        self.chains.append(chain)
+        final = chain.step_data[-1] if chain.step_data else None
+        if not chain.finished or final is None or final.get("error"):
+            return
+        key = normalize_answer(final.get("content", ""))
+        self.tally[key] += 1 if self.method == "majority" else chain_confidence(chain)
+        self.examples.setdefault(key, final.get("content", ""))
+
+    def leader(self):
+        ranked = sorted(self.tally.items(), key=lambda item: item[1], reverse=True)
+        if not ranked:
+            return None, 0, 0
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0
+        return ranked[0][0], ranked[0][1], runner_up
+
+    def decided(self):
+        # True once the remaining chains could not overturn the current leader
+        key, lead, runner_up = self.leader()
+        remaining = self.k - len(self.chains)
+        return key is not None and lead > runner_up + remaining * self.max_weight
+
+    def result(self, started, stopped_early):
+        key, lead, _ = self.leader()
+        return {
+            "answer": self.examples.get(key),
+            "votes": dict(self.tally),
+            "method": self.method,
+            "agreement": lead / sum(self.tally.values()) if self.tally else 0.0,
+            "completed_chains": len(self.chains),
+            "requested_chains": self.k,
+            "stopped_early": stopped_early,
+            "total_time": time.time() - started,
+            "chains": self.chains,
+        }
+
+
+def run_self_consistency(prompt, api_handler, k=5, method="majority", max_workers=None, resume=True,
+                         **chain_options):
+    # Run k chains on a thread pool and return the vote result
+    vote = Vote(k, method)
+    stop = threading.Event()
+    started = time.time()
+
+    def run_chain(index):
+        set_cache_sample(index)
+        chain = ReasoningChain(prompt, **chain_options)
+        for _ in generate_response(prompt, api_handler, chain=chain, resume=resume):
+            if stop.is_set():
+                break
+        return chain
+
+    executor = ThreadPoolExecutor(max_workers=max_workers or k, thread_name_prefix="multi1-consistency")
+    pending = {executor.submit(run_chain, index) for index in range(k)}
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                vote.add(future.result())
+            if pending and vote.decided():
+                # Running chains stop at their next step; queued ones never start
+                stop.set()
+                return vote.result(started, stopped_early=True)
+        return vote.result(started, stopped_early=False)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def arun_self_consistency(prompt, api_handler, k=5, method="majority", max_concurrent=None, resume=True,
+                                **chain_options):
+    # Async version: the chains share the event loop and undecided ones are cancelled.
+    # At most max_concurrent chains (default: all k) run at once.
+    vote = Vote(k, method)
+    started = time.time()
+    slots = asyncio.Semaphore(max_concurrent or k)
+
+    async def run_chain(index):
+        async with slots:
+            set_cache_sample(index)
+            chain = ReasoningChain(prompt, **chain_options)
+            async for _ in agenerate_response(prompt, api_handler, chain=chain, resume=resume):
+                pass
+            return chain
+
+    pending = {asyncio.ensure_future(run_chain(index)) for index in range(k)}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                vote.add(task.result())
+            if pending and vote.decided():
+                return vote.result(started, stopped_early=True)
+        return vote.result(started, stopped_early=False)
+    finally:
+        for task in pending:
+            task.cancel()
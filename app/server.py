@@ -0,0 +1,366 @@
+import argparse
+import asyncio
+import json
+import time
+from http import HTTPStatus
+from urllib.parse import urlsplit
+from api_handlers import BACKENDS, get_handler
+from batch import parse_limits, resolve_backend
+from config import load_env_vars
+from http_session import aclose_async_client
+from logger import logger
+from prompts import PromptNotFoundError
+from reasoning import ReasoningChain, agenerate_response
+
+# Standalone HTTP API around the reasoning engine, for calling multi1 from
+# other services without Streamlit. Runs on a single asyncio event loop with
+# agenerate_response and the pooled handlers from get_handler.
+#
+#   POST /v1/reason   {"query": "...", "backend": "Groq", "stream": true,
+#                      "prompt_name": ..., "prompt_version": ..., "max_steps": ...,
+#                      "confidence_threshold": ..., "token_budget": ..., "time_budget": ...,
+#                      "resume": true}
+#                     With a trace store (MULTI1_TRACE_DB) and "resume" (the default), a
+#                     chain that already ran is replayed or resumed from its last step.
+#                     With "stream" (the default) steps are sent as server-sent
+#                     events (step, final, done, error); otherwise one JSON body.
+#   GET  /v1/stats    active and queued chains per backend
+#   GET  /health
+#
+# Each backend runs at most `concurrency` chains at once; further requests wait
+# in a bounded queue. A full queue is answered with 429 and a request that
+# waited longer than the queue timeout with 503, both with Retry-After.
+# "max_steps" is capped at --max-steps (25 by default) for the same reason.
+#
+#   python app/server.py --port 8000 --concurrency 8 --backend-concurrency Ollama=2
+
+MAX_BODY_BYTES = 64 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+MAX_STEPS = 25
+CHAIN_OPTIONS = ("prompt_name", "prompt_version", "max_steps")
+BUDGET_OPTIONS = ("confidence_threshold", "token_budget", "time_budget")
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class BackendQueue:
+    # Concurrency limit plus a bounded wait queue for one backend
+    def __init__(self, concurrency, max_queue, queue_timeout):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.completed = 0
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "completed": self.completed,
+        }
+
+    async def acquire(self):
+        # Admission control: reject right away when the queue is full
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, "Too many queued requests for this backend",
+                            {"Retry-After": str(max(1, int(self.queue_timeout / 4)))})
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Timed out waiting for a free slot",
+                            {"Retry-After": str(max(1, int(self.queue_timeout / 2)))})
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self.completed += 1
+        self.semaphore.release()
+
+
+class Request:
+    def __init__(self, method, target, headers, body):
+        self.method = method
+        self.path = urlsplit(target).path
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self):
+        return self.headers.get("connection", "").lower() != "close"
+
+    def json(self):
+        try:
+            return json.loads(self.body or b"{}")
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Request body is not valid JSON")
+
+
+async def read_request(reader):
+    # Parse one HTTP/1.1 request; None when the client closed the connection
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Headers too large")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name:
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method, target, headers, body)
+
+
+def _response_head(status, headers):
+    status = HTTPStatus(status)
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def send_json(writer, status, body, keep_alive=True, headers=None):
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    head = {
+        "Content-Type": "application/json",
+        "Content-Length": str(len(data)),
+        "Connection": "keep-alive" if keep_alive else "close",
+    }
+    head.update(headers or {})
+    writer.write(_response_head(status, head) + data)
+    await writer.drain()
+
+
+class SSEStream:
+    # Server-sent events over a connection that is closed when the stream ends
+    def __init__(self, writer):
+        self.writer = writer
+
+    async def start(self):
+        self.writer.write(_response_head(HTTPStatus.OK, {
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "Connection": "close",
+            "X-Accel-Buffering": "no",
+        }))
+        await self.writer.drain()
+
+    async def send(self, event, data):
+        payload = json.dumps(data, ensure_ascii=False)
+        self.writer.write(f"event: {event}\ndata: {payload}\n\n".encode("utf-8"))
+        # Raises ConnectionError once the client has gone away
+        await self.writer.drain()
+
+
+class ReasoningServer:
+    def __init__(self, default_backend="Ollama", concurrency=4, backend_limits=None, max_queue=64, queue_timeout=30.0,
+                 max_steps=MAX_STEPS):
+        self.default_backend = default_backend
+        self.max_steps = max_steps
+        self.concurrency = concurrency
+        self.backend_limits = backend_limits or {}
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.queues = {}
+        self.started = time.time()
+
+    def _queue(self, backend):
+        if backend not in self.queues:
+            self.queues[backend] = BackendQueue(self.backend_limits.get(backend, self.concurrency),
+                                                self.max_queue, self.queue_timeout)
+        return self.queues[backend]
+
+    def _parse_reason_request(self, request):
+        body = request.json()
+        if not isinstance(body, dict) or not isinstance(body.get("query"), str) or not body["query"].strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Expected a JSON object with a non-empty "query"')
+        if body.get("backend") is not None and not isinstance(body["backend"], str):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, '"backend" must be a string')
+        try:
+            backend = resolve_backend(body["backend"]) if body.get("backend") else self.default_backend
+        except ValueError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+        options = {key: body[key] for key in CHAIN_OPTIONS if body.get(key) is not None}
+        if "prompt_name" in options and not isinstance(options["prompt_name"], str):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, '"prompt_name" must be a string')
+        for key in ("prompt_version", "max_steps"):
+            value = options.get(key)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f'"{key}" must be a positive integer')
+        if options.get("max_steps", 0) > self.max_steps:
+            # Every chain holds an admission slot until it ends
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f'"max_steps" must be at most {self.max_steps}')
+        options["budget"] = {key: body[key] for key in BUDGET_OPTIONS if body.get(key) is not None}
+        for key, value in options["budget"].items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f'"{key}" must be a non-negative number')
+        try:
+            chain = ReasoningChain(body["query"], **options)
+        except PromptNotFoundError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e))
+        return body, backend, chain
+
+    def _step_record(self, index, step):
+        title, content, thinking_time = step
+        return {"index": index, "title": title, "content": content, "thinking_time": thinking_time}
+
+    async def reason(self, request, writer):
+        body, backend, chain = self._parse_reason_request(request)
+        handler = get_handler(backend, load_env_vars())
+        queue = self._queue(backend)
+        await queue.acquire()
+        try:
+            if body.get("stream", True):
+                await self._reason_stream(body, backend, handler, chain, writer)
+                return False
+            async for _ in agenerate_response(body["query"], handler, chain=chain, resume=body.get("resume", True) is not False):
+                pass
+            steps, total_thinking_time = chain.result()
+            await send_json(writer, HTTPStatus.OK, {
+                "backend": backend,
+                "steps": [self._step_record(index, step) for index, step in enumerate(steps)],
+                "total_thinking_time": total_thinking_time,
+                "stop_reason": chain.stop_reason,
+                "error": any(step.get("error") for step in chain.step_data),
+            }, request.keep_alive)
+            return request.keep_alive
+        finally:
+            queue.release()
+
+    async def _reason_stream(self, body, backend, handler, chain, writer):
+        stream = SSEStream(writer)
+        await stream.start()
+        sent = 0
+        try:
+            async for steps, total_thinking_time in agenerate_response(body["query"], handler, chain=chain,
+                                                                       resume=body.get("resume", True) is not False):
+                for step in steps[sent:]:
+                    event = "final" if step[0] == "Final Answer" else "step"
+                    await stream.send(event, self._step_record(sent, step))
+                    sent += 1
+                if total_thinking_time is not None:
+                    await stream.send("done", {"backend": backend, "steps": sent,
+                                               "total_thinking_time": total_thinking_time,
+                                               "stop_reason": chain.stop_reason})
+        except ConnectionError:
+            # The client went away; stopping here saves the remaining model calls
+            logger.info("Client disconnected after %d steps; chain stopped", sent)
+        except Exception as e:
+            logger.error("Error generating response: %s", e, exc_info=True)
+            try:
+                await stream.send("error", {"error": str(e)})
+            except ConnectionError:
+                pass
+
+    async def route(self, request, writer):
+        # Handle one request; returns whether the connection can be reused
+        if request.path == "/v1/reason":
+            if request.method != "POST":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST", {"Allow": "POST"})
+            return await self.reason(request, writer)
+        if request.method != "GET":
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET", {"Allow": "GET"})
+        if request.path == "/health":
+            await send_json(writer, HTTPStatus.OK, {"status": "ok", "uptime": time.time() - self.started},
+                            request.keep_alive)
+        elif request.path == "/v1/stats":
+            await send_json(writer, HTTPStatus.OK, {
+                "backends": {backend: queue.stats() for backend, queue in self.queues.items()},
+            }, request.keep_alive)
+        else:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown path {request.path}")
+        return request.keep_alive
+
+    async def handle_connection(self, reader, writer):
+        try:
+            keep_alive = True
+            while keep_alive:
+                request = None
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    keep_alive = await self.route(request, writer)
+                except HTTPError as e:
+                    keep_alive = request is not None and request.keep_alive
+                    await send_json(writer, e.status, {"error": str(e)}, keep_alive, e.headers)
+                except ConnectionError:
+                    break
+                except Exception as e:
+                    logger.error("Unhandled server error: %s", e, exc_info=True)
+                    await send_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error"}, False)
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        logger.info("multi1 API listening on http://%s:%d", host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await aclose_async_client()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve multi1 reasoning chains over HTTP with server-sent events")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--backend", default="Ollama", help=f"Default backend: {', '.join(BACKENDS)}")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent chains per backend")
+    parser.add_argument("--backend-concurrency", action="append", metavar="BACKEND=N",
+                        help="Override the concurrency limit for one backend (repeatable)")
+    parser.add_argument("--max-queue", type=int, default=64, help="Requests allowed to wait per backend before 429")
+    parser.add_argument("--queue-timeout", type=float, default=30.0, help="Seconds a request may wait before 503")
+    parser.add_argument("--max-steps", type=int, default=MAX_STEPS, help="Largest max_steps a request may ask for")
+    args = parser.parse_args(argv)
+
+    load_env_vars()
+    server = ReasoningServer(
+        resolve_backend(args.backend),
+        concurrency=args.concurrency,
+        backend_limits=parse_limits(args.backend_concurrency),
+        max_queue=args.max_queue,
+        queue_timeout=args.queue_timeout,
+        max_steps=args.max_steps,
+    )
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
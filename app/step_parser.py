@@ -0,0 +1,306 @@
+import json
+import re
+
+# Shared parsing pipeline for reasoning steps returned by any handler.
+#
+# Models are asked for {"title", "content", "confidence", "next_action"} but
+# regularly wrap the object in prose or code fences, use single quotes or
+# Python literals, leave trailing commas or run out of tokens mid-object.
+# parse_step tries, in order of cost:
+#   json       the text is the object itself
+#   extracted  the first JSON object found in code fences or surrounding prose
+#   repaired   a character-level repair pass (quotes, literals, commas, truncation)
+#   raw        the text itself, shown as a "Raw Response" step
+# and normalizes the result with a validator compiled from STEP_SCHEMA, so the
+# chain always receives the same keys with the same types.
+
+FINAL_ANSWER = "final_answer"
+CONTINUE = "continue"
+PARSE_METHODS = ("json", "extracted", "repaired", "raw")
+
+# Same fields as ResponseSchema in handlers/litellm_handler.py.
+# field: (type, default); a default of None means the field is optional
+STEP_SCHEMA = {
+    "title": (str, "Untitled step"),
+    "content": (str, ""),
+    "confidence": (int, None),
+    "next_action": (str, CONTINUE),
+}
+
+# Alternative key names seen in model output, after lower-casing and replacing - and spaces with _
+KEY_ALIASES = {
+    "step": "title",
+    "step_title": "title",
+    "heading": "title",
+    "thought": "content",
+    "thoughts": "content",
+    "reasoning": "content",
+    "explanation": "content",
+    "answer": "content",
+    "text": "content",
+    "confidence_level": "confidence",
+    "confidence_score": "confidence",
+    "next": "next_action",
+    "nextaction": "next_action",
+    "action": "next_action",
+}
+
+_FENCE = re.compile(r"```[a-zA-Z]*\s*\n?(.*?)(?:```|$)", re.DOTALL)
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_DANGLING_COLON = re.compile(r"\s*:\s*$")
+_DANGLING_KEY = re.compile(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*$')
+_DANGLING_COMMA = re.compile(r",\s*$")
+_MAX_EXTRACT_ATTEMPTS = 8
+
+_decoder = json.JSONDecoder()
+
+
+def _to_text(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(_to_text(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False)
+    return "" if value is None else str(value)
+
+
+def _to_confidence(value):
+    # Accepts 85, 85.0, "85", "85%" and fractions such as 0.85
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        match = _NUMBER.search(value)
+        if not match:
+            return None
+        value = float(match.group())
+    if not isinstance(value, (int, float)):
+        return None
+    if 0 < value <= 1 and isinstance(value, float):
+        value *= 100
+    return min(100, max(0, int(round(value))))
+
+
+# next_action values that end the chain, once lowercased with "-", "_" and spaces collapsed
+_FINAL_ACTIONS = {"final_answer", "final", "finalanswer"}
+_SEPARATORS = re.compile(r"[\s_-]+")
+
+
+def _to_next_action(value):
+    # Exact match only, so "not final yet" or "continue towards the final answer" keep going
+    text = _SEPARATORS.sub("_", _to_text(value).strip().strip("\"'.").lower())
+    return FINAL_ANSWER if text in _FINAL_ACTIONS else CONTINUE
+
+
+_COERCE = {"title": _to_text, "content": _to_text, "confidence": _to_confidence, "next_action": _to_next_action}
+
+
+def compile_validator(schema=STEP_SCHEMA, aliases=KEY_ALIASES):
+    # Build the validation function once: key lookup tables and coercions are
+    # resolved here so validating a step is a single pass over its keys
+    lookup = {name: name for name in schema}
+    lookup.update({alias: name for alias, name in aliases.items() if name in schema})
+    coercions = [(name, _COERCE.get(name, schema[name][0]), schema[name][1]) for name in schema]
+
+    def validate(data, is_final_answer=False):
+        # Normalized step, or None when `data` does not look like a step at all
+        if not isinstance(data, dict):
+            return None
+        found = {}
+        final_answer = None
+        for key, value in data.items():
+            normalized = str(key).strip().lower().replace("-", "_").replace(" ", "_")
+            if normalized == FINAL_ANSWER and not isinstance(value, bool):
+                final_answer = value
+                continue
+            name = lookup.get(normalized)
+            if name is not None and name not in found:
+                found[name] = value
+        if final_answer is not None and "content" not in found:
+            # {"final_answer": "..."} is a common shortcut for the last step
+            found.update(content=final_answer, next_action=FINAL_ANSWER)
+            found.setdefault("title", "Final Answer")
+        if "content" not in found and "title" not in found:
+            return None
+
+        step = {}
+        for name, coerce, default in coercions:
+            value = coerce(found[name]) if name in found else default
+            if value is not None:
+                step[name] = value
+        if is_final_answer:
+            step["next_action"] = FINAL_ANSWER
+        return step
+
+    return validate
+
+
+validate_step = compile_validator()
+
+
+def _unwrap(value):
+    # Some models return the object JSON-encoded a second time, or inside a list
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+    if isinstance(value, list) and value and isinstance(value[0], dict):
+        return value[0]
+    return value
+
+
+def extract_json(text):
+    # First JSON object in `text`, looking inside code fences first and then at
+    # every "{" in the surrounding prose; None when there is none
+    sources = [block for block in _FENCE.findall(text) if "{" in block] + [text]
+    for source in sources:
+        position = source.find("{")
+        attempts = 0
+        while position != -1 and attempts < _MAX_EXTRACT_ATTEMPTS:
+            try:
+                value, _ = _decoder.raw_decode(source, position)
+                return value
+            except ValueError:
+                attempts += 1
+                position = source.find("{", position + 1)
+    return None
+
+
+def _close_string(text, index):
+    # Whether the quote at `index` ends the string, judging by what follows it; an
+    # unescaped quote (or apostrophe) followed by more prose is part of the content
+    following = text[index + 1:index + 40]
+    rest = following.lstrip()
+    return not rest or rest[0] in ",}]:" or "\n" in following[:len(following) - len(rest)]
+
+
+def repair_json(text):
+    # Best-effort rewrite of almost-JSON into JSON: smart and single quotes,
+    # Python literals, raw newlines and stray quotes inside strings, trailing
+    # commas, and objects cut off by the token limit
+    text = text.translate(_SMART_QUOTES)
+    start = text.find("{")
+    if start == -1:
+        return None
+    out = []
+    stack = []
+    quote = None
+    index = start
+    length = len(text)
+    while index < length:
+        char = text[index]
+        if quote:
+            if char == "\\" and index + 1 < length:
+                escaped = text[index + 1]
+                out.append("'" if escaped == "'" else char + escaped)
+                index += 2
+                continue
+            if char == quote and _close_string(text, index):
+                out.append('"')
+                quote = None
+            elif char == '"':
+                out.append('\\"')
+            elif char == "\n":
+                out.append("\\n")
+            elif char == "\r":
+                out.append("\\r")
+            elif char == "\t":
+                out.append("\\t")
+            else:
+                out.append(char)
+            index += 1
+            continue
+        if char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            out.append(char)
+        elif char in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(char)
+            if not stack:
+                # Anything after the outermost object is prose
+                break
+        elif char.isalpha():
+            end = index
+            while end < length and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[index:end]
+            out.append(_LITERALS.get(word, word))
+            index = end
+            continue
+        else:
+            out.append(char)
+        index += 1
+
+    repaired = "".join(out)
+    if quote:
+        repaired += '"'
+    if stack:
+        # Truncated: drop a dangling key or comma and close what is still open
+        repaired = _DANGLING_COLON.sub("", repaired.rstrip())
+        if stack[-1] == "}":
+            repaired = _DANGLING_KEY.sub(r"\1", repaired)
+        repaired = _DANGLING_COMMA.sub("", repaired) + "".join(reversed(stack))
+    return repaired
+
+
+def _raw_step(text, is_final_answer):
+    # Old fallback kept as the last resort: show the text as it is
+    forced_final_answer = '"next_action": "final_answer"' in text.lower()
+    return {
+        "title": "Raw Response",
+        "content": text,
+        "next_action": FINAL_ANSWER if (is_final_answer or forced_final_answer) else CONTINUE,
+    }
+
+
+def parse_step_with_method(text, is_final_answer=False):
+    # (step, method) for the model output `text`, method being one of PARSE_METHODS.
+    # Empty output raises json.JSONDecodeError so the handler retries the call.
+    if isinstance(text, dict):
+        step = validate_step(text, is_final_answer)
+        if step is not None:
+            return step, "json"
+        text = json.dumps(text)
+    text = text or ""
+    stripped = text.strip()
+    if not stripped:
+        raise json.JSONDecodeError("Empty response", text, 0)
+
+    if stripped[0] in "{[\"":
+        try:
+            step = validate_step(_unwrap(json.loads(stripped)), is_final_answer)
+            if step is not None:
+                return step, "json"
+        except ValueError:
+            pass
+
+    step = validate_step(_unwrap(extract_json(stripped)), is_final_answer)
+    if step is not None:
+        return step, "extracted"
+
+    fenced = [block for block in _FENCE.findall(stripped) if "{" in block]
+    repaired = repair_json(fenced[0] if fenced else stripped)
+    if repaired is not None:
+        try:
+            step = validate_step(_unwrap(json.loads(repaired)), is_final_answer)
+            if step is not None:
+                return step, "repaired"
+        except ValueError:
+            pass
+
+    return _raw_step(stripped, is_final_answer), "raw"
+
+
+def parse_step(text, is_final_answer=False):
+    return parse_step_with_method(text, is_final_answer)[0]
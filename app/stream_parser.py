@@ -0,0 +1,123 @@
+import json
+import re
+
+# Matches the opening of a JSON string value for a given key, e.g. `"title": "`
+_KEY_PATTERN = '"{}"\\s*:\\s*"'
+
+_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+
+def _is_hex(digits):
+    return len(digits) == 4 and all(char in "0123456789abcdefABCDEF" for char in digits)
+
+
+def _decode_partial_string(text, start):
+    # Decode a JSON string from `start` onwards (the opening quote is already consumed).
+    # Returns (decoded, next_position, closed). Decoding stops before an incomplete
+    # escape sequence so it can be resumed from `next_position` once more text arrives.
+    out = []
+    i = start
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char == '"':
+            return "".join(out), i + 1, True
+        if char != '\\':
+            out.append(char)
+            i += 1
+            continue
+        if i + 1 >= length:
+            break
+        escape = text[i + 1]
+        if escape == 'u':
+            hex_digits = text[i + 2:i + 6]
+            if len(hex_digits) < 4:
+                break
+            try:
+                code = int(hex_digits, 16)
+            except ValueError:
+                out.append(hex_digits)
+                i += 6
+                continue
+            if 0xD800 <= code < 0xDC00:
+                # High surrogate: characters outside the BMP (e.g. emoji) arrive as a \uD83D\uDE00 pair
+                low = text[i + 6:i + 12]
+                if len(low) < 6 and "\\u".startswith(low[:2]):
+                    break
+                low_code = int(low[2:], 16) if low[:2] == "\\u" and _is_hex(low[2:]) else None
+                if low_code is not None and 0xDC00 <= low_code < 0xE000:
+                    out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low_code - 0xDC00)))
+                    i += 12
+                    continue
+                code = 0xFFFD
+            elif 0xDC00 <= code < 0xE000:
+                # A lone surrogate cannot be encoded as UTF-8
+                code = 0xFFFD
+            out.append(chr(code))
+            i += 6
+            continue
+        out.append(_ESCAPES.get(escape, escape))
+        i += 2
+    return "".join(out), i, False
+
+
+class StreamingStepParser:
+    # Incrementally extracts string fields (title, content, next_action) from a step
+    # that is still being generated, so the UI can render it before the JSON is complete.
+
+    def __init__(self, fields=("title", "content", "next_action")):
+        self.fields = fields
+        self._patterns = {field: re.compile(_KEY_PATTERN.format(field)) for field in fields}
+        self._positions = {}
+        self._values = {}
+        self._closed = set()
+        self._chunks = []
+
+    @property
+    def text(self):
+        # The raw text received so far
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def feed(self, chunk):
+        # Add a chunk of model output and return the fields decoded so far
+        if not chunk:
+            return self.partial()
+        self._chunks.append(chunk)
+        text = self.text
+        for field in self.fields:
+            if field in self._closed:
+                continue
+            if field not in self._positions:
+                match = self._patterns[field].search(text)
+                if not match:
+                    continue
+                self._positions[field] = match.end()
+                self._values[field] = ""
+            decoded, position, closed = _decode_partial_string(text, self._positions[field])
+            self._values[field] += decoded
+            self._positions[field] = position
+            if closed:
+                self._closed.add(field)
+        return self.partial()
+
+    def partial(self):
+        return dict(self._values)
+
+    def is_complete(self):
+        # True once the accumulated text parses as a full JSON document
+        try:
+            json.loads(self.text)
+            return True
+        except json.JSONDecodeError:
+            return False
@@ -0,0 +1,283 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from response_cache import cache_sample
+
+logger = logging.getLogger('multi1')
+
+# Persistent, append-only store of reasoning chain traces.
+#
+# Every completed step of a chain is checkpointed as one row in a SQLite
+# database (WAL mode), indexed by a hash of what determines the chain: the
+# handler (class, model, endpoint, temperature), the system prompt and query,
+# the step budget and context compaction settings and the self-consistency
+# sample. Rows are never updated, so a crash can at worst lose the step that
+# was being written.
+#
+# When a chain with the same hash is started again:
+#   finished     it is replayed from the store without any model call
+#   unfinished   (interrupted, or ended by a provider error) it resumes after
+#                its last completed step; error steps are never stored
+#   running      a chain still being generated in this process (e.g. the same
+#                query twice in a batch) is claimed by its run, so another run
+#                starts a trace of its own instead of writing into it
+#
+# Enabled with MULTI1_TRACE_DB=<path>. The stored traces double as a dataset:
+#   python app/trace_store.py list
+#   python app/trace_store.py export -o traces.jsonl
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chain_id TEXT NOT NULL,
+    query_hash TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_query_hash ON events (query_hash, id);
+CREATE INDEX IF NOT EXISTS events_chain ON events (chain_id, seq);
+"""
+
+# Event kinds: the chain's identity, one completed step, and the end of the chain
+START, STEP, FINISH = "start", "step", "finish"
+
+
+def chain_hash(api_handler, chain):
+    # Hash of everything that determines a chain's steps, shared by its reruns
+    compaction = {"strategies": sorted(chain.compactor.strategies), "keep_last": chain.compactor.keep_last}
+    payload = json.dumps(
+        [api_handler.cache_params(), chain.messages[:chain.prefix_length], chain.budget.settings(), compaction,
+         cache_sample()],
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ChainTrace:
+    # The stored events of one chain, oldest first
+    def __init__(self, chain_id, query_hash):
+        self.chain_id = chain_id
+        self.query_hash = query_hash
+        self.info = {}
+        self.steps = []
+        self.summary = None
+
+    @property
+    def finished(self):
+        return self.summary is not None
+
+    def add(self, kind, data):
+        if kind == START:
+            self.info = data
+        elif kind == STEP:
+            self.steps.append(data)
+        elif kind == FINISH:
+            self.summary = data
+
+    def to_dict(self):
+        return dict(self.info, chain_id=self.chain_id, query_hash=self.query_hash,
+                    steps=self.steps, finished=self.finished, **(self.summary or {}))
+
+
+class TraceStore:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # One connection shared by every thread; autocommit, so each event is durable on its own
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._claimed = set()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+
+    def claim(self, chain_id):
+        # Reserve a chain for the run that appends to it; False if another run holds it
+        with self._lock:
+            if chain_id in self._claimed:
+                return False
+            self._claimed.add(chain_id)
+            return True
+
+    def release(self, chain_id):
+        with self._lock:
+            self._claimed.discard(chain_id)
+
+    def append(self, chain_id, query_hash, seq, kind, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO events (chain_id, query_hash, seq, kind, data, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (chain_id, query_hash, seq, kind, json.dumps(data, ensure_ascii=False), time.time()),
+            )
+
+    def _load(self, chain_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT query_hash, kind, data FROM events WHERE chain_id = ? ORDER BY seq, id", (chain_id,)
+            ).fetchall()
+        if not rows:
+            return None
+        trace = ChainTrace(chain_id, rows[0][0])
+        for _, kind, data in rows:
+            trace.add(kind, json.loads(data))
+        return trace
+
+    def latest(self, query_hash):
+        # Most recently started chain with this hash, or None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chain_id FROM events WHERE query_hash = ? AND kind = ? ORDER BY id DESC LIMIT 1",
+                (query_hash, START),
+            ).fetchone()
+        return self._load(row[0]) if row else None
+
+    def chains(self, limit=None):
+        # Stored chains, newest first
+        query = "SELECT chain_id FROM events WHERE kind = ? ORDER BY id DESC"
+        params = (START,)
+        if limit:
+            query += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            chain_ids = [row[0] for row in self._conn.execute(query, params).fetchall()]
+        for chain_id in chain_ids:
+            trace = self._load(chain_id)
+            if trace is not None:
+                yield trace
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ChainTracer:
+    # Connects one ReasoningChain to the store: restores stored steps and checkpoints new ones
+    def __init__(self, store, chain, api_handler, resume=True):
+        self.store = store
+        self.chain = chain
+        self.query_hash = chain_hash(api_handler, chain)
+        self.trace = store.latest(self.query_hash) if resume else None
+        if self.trace is not None and not self.trace.finished and not store.claim(self.trace.chain_id):
+            # Still being generated by another run
+            self.trace = None
+        if self.trace is None:
+            self.trace = ChainTrace(uuid.uuid4().hex, self.query_hash)
+            store.claim(self.trace.chain_id)
+            params = api_handler.cache_params()
+            self._append(START, {"query": chain.prompt, "handler": params["handler"], "model": params["model"],
+                                 "started": time.time()})
+        self.seq = len(self.trace.steps) + 1
+        self.failed = False
+
+    def _append(self, kind, data, seq=0):
+        try:
+            self.store.append(self.trace.chain_id, self.query_hash, seq, kind, data)
+        except sqlite3.Error as e:
+            # Losing the trace must never cost the chain itself
+            logger.warning("Trace store write failed, no longer checkpointing this chain: %s", e)
+            self.failed = True
+
+    def stored_steps(self):
+        # (step_data, thinking_time, call_stats) of the steps completed in an earlier run
+        if self.trace.steps:
+            logger.info("%s chain %s from step %d", "Replaying" if self.trace.finished else "Resuming",
+                        self.trace.chain_id, len(self.trace.steps))
+        return [(step["step"], step["thinking_time"], step.get("call")) for step in self.trace.steps]
+
+    def checkpoint(self):
+        # Store the step the chain just recorded, and the end of the chain once it is finished
+        if self.failed:
+            return
+        chain = self.chain
+        step_data = chain.step_data[-1]
+        if step_data.get("error"):
+            # Not stored, so the next run resumes from the last good step
+            return
+        self._append(STEP, {"step": step_data, "thinking_time": chain.steps[-1][2], "call": chain.call_stats[-1]},
+                     self.seq)
+        self.seq += 1
+        if chain.finished:
+            self.finish()
+
+    def finish(self):
+        if not self.failed and not self.trace.finished:
+            self.trace.summary = {"stop_reason": self.chain.stop_reason,
+                                  "total_thinking_time": self.chain.total_thinking_time}
+            self._append(FINISH, self.trace.summary, self.seq)
+        self.release()
+
+    def release(self):
+        # Called when the run ends, finished or not, so a later run can resume the chain
+        self.store.release(self.trace.chain_id)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_trace_store():
+    # Process-wide store configured from MULTI1_TRACE_DB, or None when tracing is disabled
+    global _store
+    path = os.getenv("MULTI1_TRACE_DB")
+    if not path:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TraceStore(path)
+    return _store
+
+
+def open_tracer(chain, api_handler, resume=True):
+    # ChainTracer for a chain, or None when tracing is disabled or the store cannot be opened
+    try:
+        store = get_trace_store()
+        return ChainTracer(store, chain, api_handler, resume) if store is not None else None
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("Trace store unavailable: %s", e)
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and export stored reasoning chain traces")
+    parser.add_argument("--db", default=os.getenv("MULTI1_TRACE_DB"), help="Trace database (default: MULTI1_TRACE_DB)")
+    parser.add_argument("command", choices=("list", "export"))
+    parser.add_argument("-o", "--output", default="-", help="JSONL file for export (default: stdout)")
+    parser.add_argument("--limit", type=int, help="Only the most recent N chains")
+    parser.add_argument("--all", action="store_true", help="Export unfinished chains too")
+    args = parser.parse_args(argv)
+    if not args.db or not os.path.exists(args.db):
+        parser.error("no trace database; pass --db or set MULTI1_TRACE_DB")
+
+    store = TraceStore(args.db)
+    if args.command == "list":
+        for trace in store.chains(args.limit):
+            status = trace.summary.get("stop_reason") if trace.finished else "unfinished"
+            print(f"{trace.chain_id}  {trace.query_hash[:12]}  {len(trace.steps):3d} steps  {status:<13} "
+                  f"{trace.info.get('handler')}/{trace.info.get('model')}  {trace.info.get('query', '')[:60]!r}")
+        return
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        for trace in store.chains(args.limit):
+            if trace.finished or args.all:
+                output.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
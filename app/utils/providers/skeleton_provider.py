@@ -1,6 +1,10 @@
 from api_handlers import BaseHandler
 
 class SkeletonProviderHandler(BaseHandler):
+    # Config values passed to __init__ in this order (see BaseHandler.from_config);
+    # a cached handler is rebuilt when one of them changes
+    config_keys = ("SKELETON_PROVIDER_API_KEY", "SKELETON_PROVIDER_MODEL")
+
     def __init__(self, api_key, model):
         super().__init__()
         self.api_key = api_key
@@ -8,10 +12,11 @@ class SkeletonProviderHandler(BaseHandler):
 
     def _make_request(self, messages, max_tokens):
         # Implement the API request to your provider here
-        # Return the raw response from the API
+        # Return the text generated by the model
         pass
 
     def _process_response(self, response, is_final_answer):
-        # Process the API response and return a formatted dictionary
-        # The dictionary should have 'title', 'content', and 'next_action' keys
-        pass
\ No newline at end of file
+        # Only needed if the response is not the model's text: extract the text here.
+        # The base implementation parses it into a dictionary with 'title', 'content',
+        # 'confidence' and 'next_action' keys
+        return super()._process_response(response, is_final_answer)
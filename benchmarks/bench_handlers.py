@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from mock_llm_server import start_server, server_url  # noqa: E402
+from reasoning import ReasoningChain, agenerate_response, generate_response  # noqa: E402
+from retry_policy import RetryPolicy  # noqa: E402
+
+# End-to-end benchmark of the handlers against the local mock server: runs
+# reasoning chains through generate_response (or agenerate_response with
+# --async) and reports throughput, step latency percentiles and the client-side
+# overhead per step, i.e. the time spent outside the server.
+#
+#   python benchmarks/bench_handlers.py --chains 50 --concurrency 8 --latency 0.02 --token-rate 500
+#   python benchmarks/bench_handlers.py --handlers ollama,perplexity --malformed-rate 0.1 --error-rate 0.05 --stream
+#   python benchmarks/bench_handlers.py --step-tokens 400 --steps 8 --no-adaptive-tokens   # truncation vs. step budget
+#
+# Groq and LiteLLM need their SDKs installed.
+
+HANDLERS = ("ollama", "perplexity", "groq", "litellm")
+QUERY = "How many 'R's are in the word strawberry?"
+
+
+def build_handler(name, url):
+    if name == "ollama":
+        from api_handlers import OllamaHandler
+        return OllamaHandler(url, "mock")
+    if name == "perplexity":
+        from api_handlers import PerplexityHandler
+        return PerplexityHandler("mock-key", "mock", base_url=url)
+    if name == "groq":
+        from api_handlers import GroqHandler
+        return GroqHandler("mock-key", "mock", base_url=url)
+    if name == "litellm":
+        # The openai/ prefix makes LiteLLM talk to any OpenAI-compatible api_base
+        from api_handlers import LiteLLMHandler
+        return LiteLLMHandler("openai/mock", api_base=f"{url}/v1", api_key="mock-key")
+    raise ValueError(f"Unknown handler: {name}")
+
+
+def run_chain(handler, stream, max_steps, budget=None):
+    chain = ReasoningChain(QUERY, max_steps=max_steps, budget=budget)
+    for _ in generate_response(QUERY, handler, stream=stream, chain=chain):
+        pass
+    return chain
+
+
+async def arun_chains(handler, chains, concurrency, max_steps, budget=None):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def arun_chain():
+        async with slots:
+            chain = ReasoningChain(QUERY, max_steps=max_steps, budget=budget)
+            async for _ in agenerate_response(QUERY, handler, chain=chain):
+                pass
+            return chain
+
+    return await asyncio.gather(*(arun_chain() for _ in range(chains)))
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def budget_options(args):
+    # Step budget options for every chain (see app/budget.py)
+    return {
+        "adaptive_tokens": not args.no_adaptive_tokens,
+        "confidence_threshold": args.confidence_threshold,
+        "token_budget": args.token_budget,
+    }
+
+
+def benchmark(name, handler, server, args):
+    server.stats.reset()
+    budget = budget_options(args)
+    start = time.perf_counter()
+    if args.use_async:
+        chains = asyncio.run(arun_chains(handler, args.chains, args.concurrency, args.max_steps, budget))
+    else:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            chains = list(executor.map(lambda _: run_chain(handler, args.stream, args.max_steps, budget),
+                                       range(args.chains)))
+    elapsed = time.perf_counter() - start
+
+    calls = [call for chain in chains for call in chain.call_stats if call is not None]
+    latencies = sorted(call["latency"] for call in calls)
+    service_time = sum(server.stats.service_times)
+    overhead = (sum(latencies) - service_time) / len(latencies) if latencies else 0.0
+    outcomes = Counter(call["outcome"] for call in calls)
+    parse_methods = Counter(call.get("parse_method") or "-" for call in calls)
+    truncated = sum(call.get("finish_reason") == "length" for call in calls)
+    stop_reasons = Counter(chain.stop_reason for chain in chains)
+    completion_tokens = sum(call.get("completion_tokens") or 0 for call in calls)
+
+    print(f"{name:<11} {args.chains / elapsed:8.1f} chains/s {len(calls) / elapsed:9.1f} steps/s   "
+          f"p50 {_percentile(latencies, 0.50) * 1000:7.2f}  p95 {_percentile(latencies, 0.95) * 1000:7.2f}  "
+          f"p99 {_percentile(latencies, 0.99) * 1000:7.2f} ms   overhead {overhead * 1000:6.2f} ms/step")
+    print(f"{'':<11} server: {server.stats.requests} requests, {server.stats.errors} injected errors, "
+          f"{server.stats.malformed} malformed   client: {dict(outcomes)}, parsed {dict(parse_methods)}")
+    print(f"{'':<11} {len(calls) / args.chains:.1f} calls/chain, {completion_tokens / args.chains:.0f} completion tokens/chain, "
+          f"{truncated} truncated   stopped by {dict(stop_reasons)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the handlers end to end against a local mock LLM server")
+    parser.add_argument("--handlers", default=",".join(HANDLERS), help=f"Comma-separated subset of {', '.join(HANDLERS)}")
+    parser.add_argument("--chains", type=int, default=20, help="Reasoning chains per handler")
+    parser.add_argument("--concurrency", type=int, default=4, help="Chains running at the same time")
+    parser.add_argument("--max-steps", type=int, default=10)
+    parser.add_argument("--stream", action="store_true", help="Stream steps (sync only)")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Use agenerate_response on one event loop")
+    parser.add_argument("--latency", type=float, default=0.0, help="Server latency before the first byte, in seconds")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Server generation speed in tokens/s (0: instant)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of malformed steps")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429/503")
+    parser.add_argument("--steps", type=int, default=3, help="Steps before the mock model gives its final answer")
+    parser.add_argument("--step-tokens", type=int, default=0, help="Length the mock model's steps are padded to, in tokens")
+    parser.add_argument("--no-adaptive-tokens", action="store_true", help="Use the fixed max_tokens per step")
+    parser.add_argument("--confidence-threshold", type=float, help="Stop stepping once a step is this confident")
+    parser.add_argument("--token-budget", type=int, help="Prompt + completion tokens allowed per chain")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency, token_rate=args.token_rate, malformed_rate=args.malformed_rate,
+                          error_rate=args.error_rate, steps=args.steps, step_tokens=args.step_tokens, seed=args.seed)
+    url = server_url(server)
+    try:
+        for name in (name.strip() for name in args.handlers.split(",") if name.strip()):
+            try:
+                handler = build_handler(name, url)
+            except ImportError as e:
+                print(f"{name:<11} skipped ({e})")
+                continue
+            # Keep injected errors from turning into seconds of backoff
+            handler.retry_policy = RetryPolicy(base_delay=0.01, max_delay=0.05)
+            # Warm up connections and lazily created clients
+            run_chain(handler, args.stream, 1)
+            benchmark(name, handler, server, args)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from http_session import get_session, get_timeout  # noqa: E402
+from mock_llm_server import start_server, server_url  # noqa: E402
+
+# Compares per-request overhead of a fresh connection per call (module-level
+# requests.post, the old handler behaviour) against the pooled keep-alive session.
+
+
+def _payload():
+    return {
+        "model": "mock",
+        "messages": [{"role": "user", "content": "How many 'R's are in strawberry?"}],
+        "stream": False,
+        "format": "json",
+        "options": {"num_predict": 300, "temperature": 0.2},
+    }
+
+
+def _time_calls(post, url, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = post(url, json=_payload(), timeout=get_timeout())
+        response.raise_for_status()
+        response.json()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _report(label, timings):
+    ordered = sorted(timings)
+    p95 = ordered[int(0.95 * (len(ordered) - 1))]
+    print(f"{label:<22} mean {statistics.mean(timings) * 1000:7.3f} ms   "
+          f"p50 {statistics.median(timings) * 1000:7.3f} ms   p95 {p95 * 1000:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pooled vs unpooled HTTP calls against a local stub server")
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    server = start_server()
+    url = f"{server_url(server)}/api/chat"
+    try:
+        # Warm up both paths so the first connection setup is not counted twice
+        _time_calls(requests.post, url, 5)
+        _time_calls(get_session().post, url, 5)
+
+        unpooled = _time_calls(requests.post, url, args.iterations)
+        pooled = _time_calls(get_session().post, url, args.iterations)
+    finally:
+        server.shutdown()
+
+    _report("requests.post (before)", unpooled)
+    _report("pooled session (after)", pooled)
+    saved = statistics.mean(unpooled) - statistics.mean(pooled)
+    print(f"per-step overhead saved: {saved * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Cold-start import cost, measured with `python -X importtime` in fresh
+# interpreters. Each scenario's time is the sum of its top-level imports minus
+# those of an empty interpreter, taken as the median over --runs processes.
+#
+#   startup          what every process pays: api_handlers plus the provider registry
+#   eager (before)   importing every handler module, as api_handlers used to at import
+#   first use        loading one provider, which imports its SDK on demand
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+SCENARIOS = [
+    ("startup", "import api_handlers; api_handlers.BACKENDS"),
+    ("eager (before)", "import api_handlers\n"
+                       "for name in ('ollama', 'perplexity', 'groq', 'litellm', 'composite'):\n"
+                       "    try: __import__(f'handlers.{name}_handler')\n"
+                       "    except ImportError: pass"),
+    ("first use: Ollama", "from provider_registry import load_provider; load_provider('Ollama')"),
+    ("first use: Perplexity", "from provider_registry import load_provider; load_provider('Perplexity AI')"),
+    ("first use: Groq", "from provider_registry import load_provider; load_provider('Groq')"),
+    ("first use: LiteLLM", "from provider_registry import load_provider; load_provider('LiteLLM')"),
+]
+
+
+def import_times(code):
+    # {module: (self_us, cumulative_us, depth)} for one fresh interpreter running `code`
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=APP_DIR,
+                            capture_output=True, text=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules, result.returncode
+
+
+def total_us(modules):
+    # Top-level imports only: a nested import's time is already in its parent's cumulative time
+    return sum(cumulative for _, cumulative, depth in modules.values() if depth == 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of the app and its providers")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="Slowest modules to list per scenario")
+    args = parser.parse_args()
+
+    baseline_runs = [import_times("pass")[0] for _ in range(args.runs)]
+    baseline = statistics.median(total_us(modules) for modules in baseline_runs)
+    baseline_modules = set(baseline_runs[0])
+
+    for label, code in SCENARIOS:
+        runs = [import_times(code) for _ in range(args.runs)]
+        if any(returncode for _, returncode in runs):
+            print(f"{label:<22} failed (provider SDK not installed?)")
+            continue
+        elapsed = statistics.median(total_us(modules) for modules, _ in runs) - baseline
+        modules = runs[-1][0]
+        new_modules = [name for name in modules if name not in baseline_modules]
+        slowest = sorted(new_modules, key=lambda name: modules[name][0], reverse=True)[:args.top]
+        print(f"{label:<22} {elapsed / 1000:8.1f} ms  {len(new_modules):5d} modules   "
+              f"slowest: {', '.join(f'{name} {modules[name][0] / 1000:.1f}ms' for name in slowest)}")
+
+
+if __name__ == "__main__":
+    main()
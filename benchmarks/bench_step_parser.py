@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from step_parser import PARSE_METHODS, parse_step_with_method  # noqa: E402
+
+# Runs the shared step parser over a corpus of malformed model outputs
+# (malformed_steps.jsonl: {"kind", "output"} per line) and compares it with the
+# old handler behaviour, plain json.loads with a raw-text fallback. A step is
+# "usable" when it came back as a structured step rather than raw text, i.e.
+# when the chain can continue without another round-trip to the model.
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "malformed_steps.jsonl")
+
+
+def old_parse(text):
+    try:
+        step = json.loads(text)
+        return step, "json" if isinstance(step, dict) and "title" in step and "content" in step else "raw"
+    except json.JSONDecodeError:
+        return {"title": "Raw Response", "content": text, "next_action": "continue"}, "raw"
+
+
+def new_parse(text):
+    return parse_step_with_method(text)
+
+
+def _time_parser(parse, outputs, iterations):
+    timings = []
+    for text in outputs:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parse(text)
+        timings.append((time.perf_counter() - start) / iterations)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the step parser on malformed model outputs")
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as file:
+        corpus = [json.loads(line) for line in file if line.strip()]
+    outputs = [entry["output"] for entry in corpus]
+
+    usable = {"json.loads (before)": defaultdict(list), "step_parser (after)": defaultdict(list)}
+    methods = Counter()
+    for entry in corpus:
+        _, old_method = old_parse(entry["output"])
+        _, new_method = new_parse(entry["output"])
+        methods[new_method] += 1
+        usable["json.loads (before)"][entry["kind"]].append(old_method != "raw")
+        usable["step_parser (after)"][entry["kind"]].append(new_method != "raw")
+
+    print(f"{'kind':<18} {'before':>8} {'after':>8}")
+    for kind in dict.fromkeys(entry["kind"] for entry in corpus):
+        before = usable["json.loads (before)"][kind]
+        after = usable["step_parser (after)"][kind]
+        print(f"{kind:<18} {sum(before):>4}/{len(before):<3} {sum(after):>4}/{len(after):<3}")
+    print("parse methods: " + ", ".join(f"{method} {methods[method]}" for method in PARSE_METHODS))
+    print()
+
+    for label, parse in (("json.loads (before)", old_parse), ("step_parser (after)", new_parse)):
+        timings = _time_parser(parse, outputs, args.iterations)
+        total = sum(sum(results) for results in usable[label].values())
+        print(f"{label:<20} usable {total:>2}/{len(corpus)}   "
+              f"mean {statistics.mean(timings) * 1e6:7.2f} us   max {max(timings) * 1e6:7.2f} us")
+
+
+if __name__ == "__main__":
+    main()
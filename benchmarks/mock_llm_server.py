@@ -0,0 +1,295 @@
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stub server for benchmarking the handlers without a GPU or network
+# access. It speaks enough of two protocols:
+#   Ollama              POST /api/chat (JSON or NDJSON streaming, with eval counts)
+#   OpenAI-compatible   POST .../chat/completions (JSON or SSE streaming, with usage),
+#                       which covers Perplexity, Groq (/openai/v1) and LiteLLM's openai/ models
+#
+# Behaviour is set per server:
+#   latency         seconds before the first byte of every response
+#   token_rate      generated tokens per second (0 sends the whole answer at once)
+#   malformed_rate  fraction of steps returned in a malformed form (fences, prose, truncation, ...)
+#   error_rate      fraction of requests answered with 503 or 429
+#   steps           reasoning steps before the model asks for the final answer
+#   step_tokens     repeat each step's sentence to about this many tokens (0: one sentence)
+#
+# Like a real model, the answer is cut off at the request's max_tokens / num_predict
+# and reported with finish_reason (done_reason for Ollama) "length".
+
+STEP = {
+    "title": "Mock step",
+    "content": "This is a canned reasoning step from the mock server.",
+    "confidence": 80,
+    "next_action": "continue",
+}
+
+# Distinct content per step, so consecutive steps do not look converged
+STEP_CONTENTS = (
+    "Restate the problem and list what is known so far.",
+    "Break the word into its letters and count each one carefully.",
+    "Double-check that count against the original spelling of the word.",
+    "Consider whether the question could be read in another way.",
+    "Summarize the intermediate findings before moving towards an answer.",
+)
+
+FINAL_STEP = {
+    "title": "Final Answer",
+    "content": "This is the canned final answer from the mock server.",
+    "confidence": 90,
+    "next_action": "final_answer",
+}
+
+
+def _malform(text, rng):
+    # The kinds of damage seen in real model output (see malformed_steps.jsonl)
+    kind = rng.randrange(5)
+    if kind == 0:
+        return f"```json\n{text}\n```"
+    if kind == 1:
+        return f"Here is the next step:\n{text}\nLet me know if you want more."
+    if kind == 2:
+        return text[:int(len(text) * 0.7)]
+    if kind == 3:
+        return text.replace('"', "'")
+    return text[:-1] + ",}"
+
+
+def _count_tokens(text):
+    # Rough token count, consistent with context.estimate_tokens
+    return max(1, len(text) // 4)
+
+
+class ServerStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.malformed = 0
+        self.service_times = []
+
+    def record(self, service_time, error=False, malformed=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += error
+            self.malformed += malformed
+            self.service_times.append(service_time)
+
+    def reset(self):
+        with self._lock:
+            self.requests = self.errors = self.malformed = 0
+            self.service_times = []
+
+
+class MockLLMRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    token_rate = 0.0
+    malformed_rate = 0.0
+    error_rate = 0.0
+    steps = 3
+    step_tokens = 0
+    rng = random.Random(0)
+    rng_lock = threading.Lock()
+    stats = None
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; avoid Nagle/delayed-ACK stalls on keep-alive
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        # Clients may drop keep-alive connections at any time; that is not an error here
+        try:
+            super().handle()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+
+    def _random(self):
+        with self.rng_lock:
+            return self.rng.random()
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _answer(self, messages):
+        # The step text for this conversation: a final answer once `steps` steps are in
+        assistant_steps = sum(1 for message in messages if message.get("role") == "assistant") - 1
+        if assistant_steps >= self.steps:
+            step = FINAL_STEP
+        else:
+            content = STEP_CONTENTS[max(0, assistant_steps) % len(STEP_CONTENTS)]
+            if self.step_tokens:
+                # Repeat the sentence until the step is about step_tokens long
+                repeats = max(1, (self.step_tokens * 4 - len(json.dumps(STEP))) // (len(content) + 1))
+                content = " ".join([content] * repeats)
+            step = dict(STEP, content=content)
+        text = json.dumps(step)
+        with self.rng_lock:
+            malformed = self.rng.random() < self.malformed_rate
+            if malformed:
+                text = _malform(text, self.rng)
+        return text, malformed
+
+    def _pieces(self, text):
+        # Split the answer into ~4-character "tokens", paced at token_rate
+        pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+        delay = 1.0 / self.token_rate if self.token_rate else 0.0
+        for piece in pieces:
+            if delay:
+                time.sleep(delay)
+            yield piece
+
+    def do_POST(self):
+        start = time.perf_counter()
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.split("?")[0]
+        if path == "/api/chat":
+            protocol = "ollama"
+        elif path.endswith("/chat/completions"):
+            protocol = "openai"
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+            return
+
+        if self.latency:
+            time.sleep(self.latency)
+        if self._random() < self.error_rate:
+            if self._random() < 0.5:
+                self._send_json(429, {"error": {"message": "rate limited"}}, {"Retry-After": "0"})
+            else:
+                self._send_json(503, {"error": {"message": "overloaded"}})
+            self.stats.record(time.perf_counter() - start, error=True)
+            return
+
+        messages = request.get("messages", [])
+        text, malformed = self._answer(messages)
+        prompt_tokens = sum(_count_tokens(str(message.get("content", ""))) for message in messages)
+        completion_tokens = _count_tokens(text)
+        finish_reason = "stop"
+        limit = request.get("max_tokens") or request.get("options", {}).get("num_predict")
+        if limit and completion_tokens > limit:
+            text, completion_tokens, finish_reason = text[:limit * 4], limit, "length"
+        # Ollama streams unless told otherwise; OpenAI-compatible APIs only when asked
+        stream = request.get("stream", protocol == "ollama")
+        if protocol == "ollama":
+            self._ollama(request, text, stream, prompt_tokens, completion_tokens, finish_reason, start)
+        else:
+            self._openai(request, text, stream, prompt_tokens, completion_tokens, finish_reason)
+        self.stats.record(time.perf_counter() - start, malformed=malformed)
+
+    def _ollama(self, request, text, stream, prompt_tokens, completion_tokens, finish_reason, start):
+        model = request.get("model", "mock")
+        generation_time = completion_tokens / self.token_rate if self.token_rate else 0.0
+        counts = {
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.latency * 1e9),
+            "eval_count": completion_tokens,
+            "eval_duration": int(generation_time * 1e9),
+            "load_duration": 0,
+            "done_reason": finish_reason,
+        }
+        if not stream:
+            if generation_time:
+                time.sleep(generation_time)
+            body = {"model": model, "message": {"role": "assistant", "content": text}, "done": True}
+            body.update(counts, total_duration=int((time.perf_counter() - start) * 1e9))
+            self._send_json(200, body)
+            return
+        self._start_stream("application/x-ndjson")
+        for piece in self._pieces(text):
+            line = {"model": model, "message": {"role": "assistant", "content": piece}, "done": False}
+            self._write_chunk((json.dumps(line) + "\n").encode())
+        final = {"model": model, "message": {"role": "assistant", "content": ""}, "done": True}
+        final.update(counts, total_duration=int((time.perf_counter() - start) * 1e9))
+        self._write_chunk((json.dumps(final) + "\n").encode())
+        self._end_stream()
+
+    def _openai(self, request, text, stream, prompt_tokens, completion_tokens, finish_reason):
+        model = request.get("model", "mock")
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        base = {"id": "mock", "created": int(time.time()), "model": model}
+        if not stream:
+            if self.token_rate:
+                time.sleep(completion_tokens / self.token_rate)
+            self._send_json(200, dict(
+                base,
+                object="chat.completion",
+                choices=[{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}],
+                usage=usage,
+            ))
+            return
+        self._start_stream("text/event-stream")
+        for piece in self._pieces(text):
+            event = dict(base, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+        event = dict(base, object="chat.completion.chunk",
+                     choices=[{"index": 0, "delta": {}, "finish_reason": finish_reason}], usage=usage)
+        self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._end_stream()
+
+
+def start_server(host="127.0.0.1", port=0, latency=0.0, token_rate=0.0, malformed_rate=0.0, error_rate=0.0,
+                 steps=3, step_tokens=0, seed=0):
+    # Start the stub server in a background thread and return it; port 0 picks a free port.
+    # Request counts and server-side service times are kept in server.stats.
+    stats = ServerStats()
+    handler = type("ConfiguredHandler", (MockLLMRequestHandler,), {
+        "latency": latency,
+        "token_rate": token_rate,
+        "malformed_rate": malformed_rate,
+        "error_rate": error_rate,
+        "steps": steps,
+        "step_tokens": step_tokens,
+        "rng": random.Random(seed),
+        "rng_lock": threading.Lock(),
+        "stats": stats,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.stats = stats
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def server_url(server):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
@@ -0,0 +1,132 @@
+import budget
+from budget import StepBudget, budget_from_env, similarity
+
+
+def step(content="some reasoning", confidence=None):
+    data = {"title": "T", "content": content, "next_action": "continue"}
+    if confidence is not None:
+        data["confidence"] = confidence
+    return data
+
+
+def test_first_step_uses_step_max_tokens():
+    assert StepBudget().step_tokens() == 300
+    assert StepBudget(adaptive_tokens=False).step_tokens() == 300
+
+
+def test_short_steps_do_not_shrink_max_tokens_by_default():
+    steps = StepBudget()
+    steps.step_tokens()
+    steps.observe(step(), 1.0, {"completion_tokens": 60})
+    assert steps.step_tokens() == 300
+
+
+def test_shrinking_is_opt_in():
+    steps = StepBudget(min_step_tokens=64)
+    steps.step_tokens()
+    steps.observe(step(), 1.0, {"completion_tokens": 60})
+    assert steps.step_tokens() == 90
+
+
+def test_long_steps_grow_max_tokens_up_to_the_cap():
+    steps = StepBudget(max_step_tokens=1024)
+    steps.step_tokens()
+    steps.observe(step(), 1.0, {"completion_tokens": 400})
+    assert steps.step_tokens() == 600
+    steps.observe(step(), 1.0, {"completion_tokens": 900})
+    assert steps.step_tokens() == 1024
+
+
+def test_truncated_step_doubles_max_tokens():
+    steps = StepBudget()
+    assert steps.step_tokens() == 300
+    steps.observe(step(), 1.0, {"completion_tokens": 150, "finish_reason": "length"})
+    assert steps.truncated_steps == 1
+    assert steps.step_tokens() == 600
+
+
+def test_final_tokens_never_below_final_max_tokens():
+    steps = StepBudget(min_step_tokens=64)
+    steps.observe(step(), 1.0, {"completion_tokens": 20})
+    assert steps.final_tokens() == 200
+    steps.observe(step(), 1.0, {"completion_tokens": 500})
+    assert steps.final_tokens() == 750
+
+
+def run(budget_steps, calls):
+    # max_tokens asked for each step when the steps are observed with these call records
+    sizes = []
+    for call in calls:
+        sizes.append(budget_steps.step_tokens())
+        budget_steps.observe(step(), 1.0, call)
+    sizes.append(budget_steps.step_tokens())
+    return sizes
+
+
+def test_cache_hits_size_steps_like_the_original_run():
+    lengths = [450, 120, 700]
+    original = run(StepBudget(min_step_tokens=64), [{"outcome": "ok", "completion_tokens": n} for n in lengths])
+    replay = StepBudget(min_step_tokens=64)
+    assert run(replay, [{"outcome": "cache_hit", "cached_completion_tokens": n} for n in lengths]) == original
+    # Nothing was spent on the replay
+    assert replay.used_tokens == 0
+
+
+def test_cache_hit_without_stored_length_uses_the_same_estimate():
+    content = "x" * 400
+    original = StepBudget(min_step_tokens=16)
+    original.observe(step(content), 1.0, {"outcome": "ok"})
+    replay = StepBudget(min_step_tokens=16)
+    replay.observe(step(content), 1.0, {"outcome": "cache_hit"})
+    assert original.lengths == replay.lengths
+
+
+def test_confidence_stop():
+    steps = StepBudget(confidence_threshold=90, min_steps=2)
+    assert steps.stop_reason(step("a", confidence=95), 1) is None
+    assert steps.stop_reason(step("b", confidence=95), 2) == "confidence"
+
+
+def test_convergence_stop():
+    steps = StepBudget(convergence_threshold=0.9)
+    assert steps.stop_reason(step("the answer is 42"), 1) is None
+    assert steps.stop_reason(step("The answer is 42."), 2) == "converged"
+    assert similarity("a b", "c d") == 0.0
+
+
+def test_token_budget_stop():
+    steps = StepBudget(token_budget=1000)
+    steps.observe(step(), 1.0, {"prompt_tokens": 200, "completion_tokens": 100})
+    assert steps.stop_reason(step("one"), 1) is None
+    steps.observe(step(), 1.0, {"prompt_tokens": 200, "completion_tokens": 100})
+    assert steps.stop_reason(step("two"), 2) == "token_budget"
+
+
+def test_time_budget_stop(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(budget.time, "time", lambda: now[0])
+    steps = StepBudget(time_budget=10)
+    steps.observe(step(), 2.0, {"completion_tokens": 10})
+    assert steps.stop_reason(step("one"), 1) is None
+    now[0] += 5
+    # 5 s spent and one more step plus the final answer take about 2 s each
+    assert steps.stop_reason(step("two"), 2) is None
+    now[0] += 2
+    assert steps.stop_reason(step("three"), 3) == "time_budget"
+
+
+def test_max_steps_stop():
+    steps = StepBudget(max_steps=2, convergence_threshold=None)
+    assert steps.stop_reason(step("one"), 2) is None
+    assert steps.stop_reason(step("two"), 3) == "max_steps"
+
+
+def test_budget_from_env(monkeypatch):
+    monkeypatch.setenv("MULTI1_ADAPTIVE_TOKENS", "false")
+    monkeypatch.setenv("MULTI1_MIN_STEP_TOKENS", "100")
+    monkeypatch.setenv("MULTI1_TOKEN_BUDGET", "5000")
+    steps = budget_from_env(token_budget=2000)
+    assert not steps.adaptive_tokens
+    assert steps.min_step_tokens == 100
+    # Options given in code take precedence over the environment
+    assert steps.settings()["token_budget"] == 2000
@@ -0,0 +1,67 @@
+import json
+import pytest
+from context import ContextCompactor, estimate_tokens
+
+PREFIX = [
+    {"role": "system", "content": "system prompt"},
+    {"role": "user", "content": "query"},
+    {"role": "assistant", "content": "Thank you! I will now think step by step."},
+]
+
+
+def steps(count):
+    messages = list(PREFIX)
+    for index in range(1, count + 1):
+        step = {"title": f"Step {index}", "content": f"Reasoning {index}. More detail.", "confidence": 80,
+                "next_action": "continue"}
+        messages.append({"role": "assistant", "content": json.dumps(step)})
+        messages.append({"role": "user", "content": "Please continue."})
+    return messages
+
+
+def assistant_steps(messages):
+    return [json.loads(message["content"]) for message in messages[len(PREFIX):]
+            if message["role"] == "assistant" and message["content"].startswith("{")]
+
+
+def test_none_sends_the_history_unchanged():
+    messages = steps(4)
+    assert ContextCompactor("none").compact(messages, len(PREFIX)) is messages
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        ContextCompactor("strip,shrink")
+
+
+def test_strip_keeps_only_the_step_fields():
+    compacted = ContextCompactor("strip").compact(steps(2), len(PREFIX))
+    assert compacted[:len(PREFIX)] == PREFIX
+    assert all(set(step) == {"title", "content", "next_action"} for step in assistant_steps(compacted))
+
+
+def test_last_n_drops_older_steps():
+    compacted = ContextCompactor("last_n", keep_last=2).compact(steps(5), len(PREFIX))
+    assert [step["title"] for step in assistant_steps(compacted)] == ["Step 4", "Step 5"]
+    assert compacted[:len(PREFIX)] == PREFIX
+
+
+def test_summarize_replaces_older_steps_with_one_message():
+    compacted = ContextCompactor("summarize", keep_last=1).compact(steps(3), len(PREFIX))
+    summaries = [message["content"] for message in compacted if message["content"].startswith("Summary")]
+    assert len(summaries) == 1
+    assert "1. Step 1: Reasoning 1." in summaries[0] and "2. Step 2: Reasoning 2." in summaries[0]
+    assert [step["title"] for step in assistant_steps(compacted)] == ["Step 3"]
+    assert estimate_tokens(compacted) < estimate_tokens(steps(3))
+
+
+def test_prefix_stability():
+    assert ContextCompactor("strip").prefix_stable
+    compactor = ContextCompactor("strip,summarize", keep_last=2)
+    assert not compactor.prefix_stable
+    stable = compactor.stable_variant()
+    assert stable.prefix_stable and stable.strategies == {"strip"}
+    # A stable compactor never changes a message it has already sent
+    earlier = stable.compact(steps(2), len(PREFIX))
+    later = stable.compact(steps(4), len(PREFIX))
+    assert later[:len(earlier)] == earlier
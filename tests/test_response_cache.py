@@ -0,0 +1,120 @@
+import json
+import response_cache
+from api_handlers import BaseHandler
+from metrics import last_call, record_finish_reason, record_usage
+from response_cache import ResponseCache, cache_key, set_cache_sample
+from retry_policy import RetryPolicy
+
+MESSAGES = [{"role": "system", "content": "s"}, {"role": "user", "content": "q"}]
+PARAMS = {"handler": "FakeHandler", "model": "m", "endpoint": None, "temperature": None}
+
+
+def test_key_depends_on_everything_that_determines_the_response():
+    key = cache_key(PARAMS, MESSAGES, 300, False)
+    assert key == cache_key(dict(PARAMS), list(MESSAGES), 300, False)
+    assert key != cache_key(PARAMS, MESSAGES, 600, False)
+    assert key != cache_key(PARAMS, MESSAGES, 300, True)
+    assert key != cache_key(dict(PARAMS, model="other"), MESSAGES, 300, False)
+    assert key != cache_key(PARAMS, MESSAGES + [{"role": "assistant", "content": "x"}], 300, False)
+
+
+def test_self_consistency_samples_get_their_own_keys():
+    try:
+        set_cache_sample(1)
+        first = cache_key(PARAMS, MESSAGES, 300, False)
+        set_cache_sample(2)
+        second = cache_key(PARAMS, MESSAGES, 300, False)
+    finally:
+        set_cache_sample(None)
+    assert first != second != cache_key(PARAMS, MESSAGES, 300, False)
+
+
+def test_get_returns_a_copy():
+    cache = ResponseCache()
+    cache.set("k", {"step": {"content": "c"}})
+    cache.get("k")["step"]["content"] = "changed"
+    assert cache.get("k") == {"step": {"content": "c"}}
+
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(ttl=10)
+    cache.set("k", 1)
+    now[0] += 5
+    assert cache.get("k") == 1
+    now[0] += 10
+    assert cache.get("k") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    ResponseCache(disk_dir=str(tmp_path)).set("abcd", {"v": 1})
+    cache = ResponseCache(disk_dir=str(tmp_path))
+    assert cache.get("abcd") == {"v": 1}
+    assert cache.stats()["disk_hits"] == 1
+
+
+class FakeHandler(BaseHandler):
+    # Answers from a list of (text, finish_reason, completion_tokens)
+    def __init__(self, responses):
+        super().__init__()
+        self.model = "m"
+        self.responses = list(responses)
+        self.requests = []
+        self.retry_policy = RetryPolicy(base_delay=0.0, max_delay=0.0)
+        self.cache = ResponseCache()
+
+    def _make_request(self, messages, max_tokens):
+        self.requests.append(max_tokens)
+        text, finish_reason, completion_tokens = self.responses.pop(0)
+        record_usage(completion_tokens=completion_tokens)
+        record_finish_reason(finish_reason)
+        return text
+
+
+STEP = json.dumps({"title": "T", "content": "C", "next_action": "continue"})
+
+
+def test_clean_step_is_cached_with_its_length():
+    handler = FakeHandler([(STEP, "stop", 42)])
+    first = handler.make_api_call(MESSAGES, 300)
+    second = handler.make_api_call(MESSAGES, 300)
+    assert first == second and len(handler.requests) == 1
+    assert last_call().outcome == "cache_hit"
+    assert last_call().to_dict()["cached_completion_tokens"] == 42
+
+
+def test_raw_step_is_not_cached():
+    handler = FakeHandler([("not json at all", "stop", 5), (STEP, "stop", 5)])
+    assert handler.make_api_call(MESSAGES, 300)["title"] == "Raw Response"
+    assert handler.make_api_call(MESSAGES, 300)["title"] == "T"
+    assert len(handler.requests) == 2
+
+
+def test_truncated_step_is_retried_with_more_room_and_only_the_result_cached():
+    handler = FakeHandler([(STEP, "length", 300), (STEP, "stop", 350)])
+    handler.make_api_call(MESSAGES, 300)
+    assert handler.requests == [300, 600]
+    handler.make_api_call(MESSAGES, 300)
+    assert len(handler.requests) == 2
+    assert last_call().to_dict()["cached_completion_tokens"] == 350
+
+
+def test_step_still_truncated_after_retries_is_not_cached():
+    handler = FakeHandler([(STEP, "length", 300)] * 4)
+    handler.retry_policy = RetryPolicy(max_attempts=2, base_delay=0.0, max_delay=0.0)
+    assert handler.make_api_call(MESSAGES, 300)["title"] == "T"
+    handler.make_api_call(MESSAGES, 300)
+    assert len(handler.requests) == 4
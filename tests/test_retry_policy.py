@@ -0,0 +1,102 @@
+import json
+import pytest
+from retry_policy import (BadRequestError, CircuitBreaker, CircuitOpenError, ErrorClassification, RetryPolicy,
+                          TruncatedResponseError, classify_error, parse_retry_after)
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = FakeResponse(status_code, headers)
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+class RateLimitError(Exception):
+    pass
+
+
+@pytest.mark.parametrize("status", [408, 429, 500, 502, 503, 529])
+def test_retryable_status_is_a_provider_failure(status):
+    assert classify_error(HTTPError(status)) == ErrorClassification(True, True, None)
+
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404, 422])
+def test_client_errors_are_fatal(status):
+    assert classify_error(HTTPError(status)) == ErrorClassification(False, False, None)
+
+
+def test_retry_after_header():
+    assert classify_error(HTTPError(429, {"retry-after": "7"})).retry_after == 7.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+
+
+def test_errors_without_status():
+    assert classify_error(APIConnectionError()) == ErrorClassification(True, True, None)
+    assert classify_error(RateLimitError()).retryable
+    assert classify_error(BadRequestError("bad")) == ErrorClassification(False, False, None)
+    assert classify_error(CircuitOpenError("open")) == ErrorClassification(False, False, None)
+    # Malformed output and truncation are worth another try, but the provider is healthy
+    assert classify_error(json.JSONDecodeError("x", "", 0)) == ErrorClassification(True, False, None)
+    assert classify_error(TruncatedResponseError({}, 300)) == ErrorClassification(True, False, None)
+
+
+def test_backoff_is_capped_and_jittered():
+    policy = RetryPolicy(base_delay=1.0, max_delay=5.0, multiplier=2.0)
+    for attempt in range(10):
+        delay = policy.backoff(attempt)
+        assert 0 <= delay <= min(5.0, 2.0 ** attempt)
+
+
+def test_next_delay():
+    policy = RetryPolicy(max_attempts=3, base_delay=0.5, max_retry_after=60)
+    retryable = ErrorClassification(True, True, None)
+    assert policy.next_delay(retryable, 0) is not None
+    assert policy.next_delay(retryable, 2) is None
+    assert policy.next_delay(ErrorClassification(False, False, None), 0) is None
+    assert 10 <= policy.next_delay(ErrorClassification(True, True, 10), 0) <= 10.5
+    # Waiting longer than max_retry_after is not worth it
+    assert policy.next_delay(ErrorClassification(True, True, 120), 0) is None
+
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half-open"
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    # A failed trial opens the circuit again; a successful one closes it
+    breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+    breaker.before_call()
@@ -0,0 +1,64 @@
+import pytest
+from self_consistency import Vote, chain_confidence, normalize_answer
+
+
+class FakeChain:
+    # Just what Vote reads from a ReasoningChain
+    def __init__(self, answer, confidence=None, finished=True, error=False):
+        final = {"title": "Final Answer", "content": answer, "next_action": "final_answer"}
+        if confidence is not None:
+            final["confidence"] = confidence
+        if error:
+            final["error"] = True
+        self.step_data = [final]
+        self.finished = finished
+
+
+def test_normalize_answer():
+    assert normalize_answer("**The answer is 42.**") == normalize_answer("the answer is  42")
+
+
+def test_majority_is_decided_once_it_cannot_be_overturned():
+    vote = Vote(5)
+    vote.add(FakeChain("42"))
+    vote.add(FakeChain("42"))
+    assert not vote.decided()
+    vote.add(FakeChain("42"))
+    # 3 votes against at most 2 remaining
+    assert vote.decided()
+    result = vote.result(0, stopped_early=True)
+    assert result["answer"] == "42" and result["agreement"] == 1.0
+
+
+def test_split_vote_is_not_decided_early():
+    vote = Vote(4)
+    for answer in ("42", "41", "42"):
+        vote.add(FakeChain(answer))
+    assert not vote.decided()
+    vote.add(FakeChain("41"))
+    assert not vote.decided()
+
+
+def test_errored_and_unfinished_chains_do_not_vote():
+    vote = Vote(3)
+    vote.add(FakeChain("oops", error=True))
+    vote.add(FakeChain("partial", finished=False))
+    assert vote.tally == {}
+    assert not vote.decided()
+    vote.add(FakeChain("42"))
+    assert vote.decided()
+
+
+def test_confidence_weighted_vote():
+    vote = Vote(3, method="confidence")
+    vote.add(FakeChain("42", confidence=90))
+    vote.add(FakeChain("41", confidence=30))
+    assert vote.leader()[0] == "42"
+    # One remaining chain could still add up to 100 for "41"
+    assert not vote.decided()
+    assert chain_confidence(FakeChain("x")) == 50
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        Vote(3, method="loudest")
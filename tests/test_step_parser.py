@@ -0,0 +1,71 @@
+import json
+import pytest
+from step_parser import CONTINUE, FINAL_ANSWER, extract_json, parse_step, parse_step_with_method, repair_json, validate_step
+
+
+def test_plain_json():
+    text = json.dumps({"title": "T", "content": "C", "confidence": 80, "next_action": "continue"})
+    step, method = parse_step_with_method(text)
+    assert method == "json"
+    assert step == {"title": "T", "content": "C", "confidence": 80, "next_action": CONTINUE}
+
+
+def test_object_in_prose_and_fences():
+    step, method = parse_step_with_method('Sure:\n```json\n{"title": "T", "content": "C"}\n```\nDone.')
+    assert method == "extracted"
+    assert step["content"] == "C"
+
+
+def test_repairs_almost_json():
+    step, method = parse_step_with_method("{'title': 'T', 'content': 'C', 'flag': True,}")
+    assert method == "repaired"
+    assert step["title"] == "T"
+
+
+def test_truncated_object_is_closed():
+    repaired = repair_json('{"title": "T", "content": "cut off mid')
+    assert json.loads(repaired) == {"title": "T", "content": "cut off mid"}
+
+
+def test_raw_fallback():
+    step, method = parse_step_with_method("no json here")
+    assert method == "raw"
+    assert step["title"] == "Raw Response"
+    assert step["next_action"] == CONTINUE
+
+
+def test_empty_output_raises_for_retry():
+    with pytest.raises(json.JSONDecodeError):
+        parse_step("   ")
+
+
+def test_aliases_and_coercion():
+    step = validate_step({"Step": "T", "reasoning": "C", "confidence_score": "85%", "action": "continue"})
+    assert step == {"title": "T", "content": "C", "confidence": 85, "next_action": CONTINUE}
+    assert validate_step({"content": "C", "confidence": 0.9})["confidence"] == 90
+
+
+def test_final_answer_shortcut():
+    step = validate_step({"final_answer": "42"})
+    assert step["content"] == "42"
+    assert step["next_action"] == FINAL_ANSWER
+
+
+def test_is_final_answer_forces_next_action():
+    assert validate_step({"content": "C", "next_action": "continue"}, is_final_answer=True)["next_action"] == FINAL_ANSWER
+
+
+@pytest.mark.parametrize("value", ["final_answer", "final", "Final Answer", "FINAL-ANSWER", " final_answer. "])
+def test_final_next_action(value):
+    assert validate_step({"content": "C", "next_action": value})["next_action"] == FINAL_ANSWER
+
+
+@pytest.mark.parametrize("value", ["continue", "not final yet", "continue towards the final answer", "finalize later", ""])
+def test_other_next_action_continues(value):
+    assert validate_step({"content": "C", "next_action": value})["next_action"] == CONTINUE
+
+
+def test_not_a_step():
+    assert validate_step({"unrelated": 1}) is None
+    assert validate_step(["not", "a", "dict"]) is None
+    assert extract_json("nothing to see") is None
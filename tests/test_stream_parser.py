@@ -0,0 +1,50 @@
+import json
+import pytest
+from stream_parser import StreamingStepParser
+
+STEP = {"title": "Step 1", "content": "ok \U0001F600 café \"quoted\"\nnext line", "next_action": "continue"}
+
+
+def feed_in_chunks(text, size):
+    parser = StreamingStepParser()
+    values = {}
+    for start in range(0, len(text), size):
+        values = parser.feed(text[start:start + size])
+        # Every partial value must be sendable as UTF-8, e.g. to the browser
+        for value in values.values():
+            value.encode("utf-8")
+    return parser, values
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 11, 1000])
+def test_any_chunking_decodes_the_same(size):
+    text = json.dumps(STEP)
+    parser, values = feed_in_chunks(text, size)
+    assert values == STEP
+    assert parser.is_complete()
+
+
+def test_surrogate_pair_is_combined():
+    text = json.dumps({"content": "ok \U0001F600"})
+    assert "\\ud83d\\ude00" in text
+    _, values = feed_in_chunks(text, 1)
+    assert values["content"] == "ok \U0001F600"
+
+
+def test_waits_for_the_low_surrogate():
+    parser = StreamingStepParser()
+    assert parser.feed('{"content": "a\\ud83d')["content"] == "a"
+    assert parser.feed('\\ude0')["content"] == "a"
+    assert parser.feed('0b"}')["content"] == "a\U0001F600b"
+
+
+def test_lone_surrogate_is_replaced():
+    _, values = feed_in_chunks('{"content": "a\\ud83d b \\ude00"}', 1)
+    assert values["content"] == "a� b �"
+
+
+def test_partial_fields_before_completion():
+    parser = StreamingStepParser()
+    values = parser.feed('{"title": "Thinking", "content": "First half')
+    assert values == {"title": "Thinking", "content": "First half"}
+    assert not parser.is_complete()